@@ -3,9 +3,9 @@ import streamlit as st
 import tempfile
 import sys
 from constants import BATCH_SIZE_DEFAULT
-from core import run_update
+from core import run_update, report_csv_bytes
 from store_profiles import STORE_PROFILES
-from utils.ui_utils import setup_log_state, reset_ui_state, make_push_with_status, render_all_sections
+from utils.ui_utils import setup_log_state, reset_ui_state, make_push_with_status, render_all_sections, flush_sections
 
 try:
     if hasattr(sys.stdout, "reconfigure"):
@@ -29,6 +29,7 @@ with st.sidebar:
     map_csv_override = st.text_input("Mapping CSV override (optional)", "")
     stock_csv_override = st.text_input("Stock CSV override (optional)", "")
     force_refresh = st.checkbox("🔄 Force refresh Google Sheets", value=True)
+    invalidate_cache = st.checkbox("♻️ Ignore cached Shopify lookups", value=False)
     stock_csv_upload = st.file_uploader("Upload Stock CSV", type=["csv"])
 
 run_btn = st.button("Run update", type="primary")
@@ -67,10 +68,13 @@ if run_btn:
                 store_profiles=STORE_PROFILES,
                 progress=push,
                 force_refresh_google_sheets=force_refresh,
+                invalidate_cache=invalidate_cache,
             )
         except FileNotFoundError as e:
             st.error(str(e))
             st.stop()
+        finally:
+            flush_sections()  # last debounced log lines, on success or any failure
 
     status_placeholder.success("✅ Update complete.")
 
@@ -80,10 +84,10 @@ if run_btn:
     if report_df is not None and not report_df.empty:
         st.subheader("Report preview")
         st.dataframe(report_df.head(200))
-        csv = report_df.to_csv(index=False).encode("utf-8")
+        csv = report_csv_bytes(report_df)
         st.download_button(
             "Download full report CSV",
             data=csv,
-            file_name=summary.get("report_filename", "report.csv"),
+            file_name=summary.get("report_filename", "report.csv").removesuffix(".gz"),
             mime="text/csv"
         )
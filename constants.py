@@ -1,10 +1,33 @@
 # constants.py
+import os
+
 API_VERSION = "2024-01"
 BATCH_SIZE_DEFAULT = 50
 SLEEP_BETWEEN_CALLS = 0.3
 RETRY_429_MAX = 5
+UPDATE_MAX_WORKERS = 4        # in-flight inventory mutation batches
+MUTATION_COST_ESTIMATE = 10   # GraphQL cost points reserved per inventorySetOnHandQuantities call
+MUTATION_ALIASES_PER_REQUEST = 5  # batches sent as aliased mutations in one GraphQL document
+SET_QUANTITIES_MAX = 250      # Shopify cap on setQuantities items per inventorySetOnHandQuantities call
+MAPPING_FETCH_WINDOWS = 8         # disjoint created_at windows for full mapping builds (1 = serial)
+MAPPING_ALIASES_PER_QUERY = 2     # windows paged per GraphQL document (keep K * page cost under 1000)
+MAPPING_FETCH_WORKERS = 4         # aliased requests in flight
+MAPPING_FETCH_WINDOW_DAYS = 365   # span split across the windows; the oldest window is open-ended
+MAPPING_PAGE_COST_ESTIMATE = 100  # first-page guess; later pages reserve the previous actualQueryCost
+MAPPING_PAGE_SIZE = 100           # products per page; drop to 50 if actualQueryCost nears 1000
 STOCK_CSV_PATH = "Stock_Update.csv"
 
+# On-disk cache for Shopify lookups that rarely change (seconds)
+SHOPIFY_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shopify_updater")
+PREFLIGHT_CACHE_TTL = 15 * 60
+LOCATIONS_CACHE_TTL = 15 * 60
+PRODUCT_TYPES_CACHE_TTL = 60 * 60
+REPORT_GZIP_ROWS = 100_000  # reports longer than this are written as .csv.gz
+STOCK_CSV_CHUNK_ROWS = 200_000  # rows per chunk when streaming stock CSVs over SIZE_ALERT_MB
+KNOWN_IDS_BLOOM_MIN_MB = 200   # mapping CSVs above this hold known variant IDs in a Bloom filter, not a set
+KNOWN_IDS_BLOOM_FP_RATE = 0.01
+KNOWN_IDS_BLOOM_CONFIRM = 3    # consecutive Bloom hits needed before an early stop (guards false positives)
+
 # Size thresholds in MB for split files
 SIZE_WARN_MB = 40
 SIZE_ALERT_MB = 50
@@ -1,8 +1,12 @@
-import os, time, json, re
+import os, time, json, re, hashlib, atexit, csv, functools
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional, Callable, Tuple
 from datetime import datetime, timedelta
 import streamlit as st
 from utils.merge_google_sheets_for_stores import run as refresh_csvs
+import numpy as np
 import pandas as pd
 import requests
 from utils.sheet_config import SHEET_SOURCES
@@ -10,14 +14,101 @@ from utils.gsheets_manager import get_services, get_credentials
 from utils.merge_google_sheets_for_stores import SIZE_WARN_MB, SIZE_ALERT_MB, SIZE_HARD_MB
 
 from constants import (
-    API_VERSION, BATCH_SIZE_DEFAULT, SLEEP_BETWEEN_CALLS, RETRY_429_MAX,
-    STOCK_CSV_PATH, size_map, colour_map
+    API_VERSION, BATCH_SIZE_DEFAULT, RETRY_429_MAX,
+    UPDATE_MAX_WORKERS, MAPPING_FETCH_WINDOWS, MAPPING_FETCH_WORKERS, MAPPING_ALIASES_PER_QUERY,
+    MAPPING_FETCH_WINDOW_DAYS, MAPPING_PAGE_COST_ESTIMATE,
+    MAPPING_PAGE_SIZE, MUTATION_COST_ESTIMATE,
+    MUTATION_ALIASES_PER_REQUEST, SET_QUANTITIES_MAX,
+    STOCK_CSV_PATH, STOCK_CSV_CHUNK_ROWS, REPORT_GZIP_ROWS, size_map, colour_map,
+    SHOPIFY_CACHE_DIR, PREFLIGHT_CACHE_TTL, LOCATIONS_CACHE_TTL, PRODUCT_TYPES_CACHE_TTL,
+    KNOWN_IDS_BLOOM_MIN_MB, KNOWN_IDS_BLOOM_FP_RATE, KNOWN_IDS_BLOOM_CONFIRM,
 )
 
+from requests.adapters import HTTPAdapter
+
+# orjson with a stdlib fallback, defined once in utils_io
+from utils.utils_io import _json_dumps, _json_loads, _atomic_write_json, _atomic_write_bytes
+
+def _build_requests_session() -> requests.Session:
+    session = requests.Session()
+    # retries are handled by gql_with_retry, not urllib3
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _build_http_client():
+    """
+    Pooled HTTP client with keep-alive. Set SHOPIFY_HTTP2=1 to use one shared
+    httpx client with HTTP/2 multiplexing (needs `pip install httpx[http2]`);
+    otherwise each thread gets its own requests.Session, since Session isn't
+    guaranteed thread-safe.
+    """
+    if os.environ.get("SHOPIFY_HTTP2") == "1":
+        try:
+            import httpx
+            return httpx.Client(http2=True, timeout=60,
+                                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+        except ImportError:
+            print("[WARN] SHOPIFY_HTTP2=1 but httpx[http2] is not installed; using requests.")
+    return None
+
+_HTTPX_CLIENT = _build_http_client()
+_THREAD_LOCAL = threading.local()
+
+
+def _session() -> requests.Session:
+    session = getattr(_THREAD_LOCAL, "session", None)
+    if session is None:
+        session = _THREAD_LOCAL.session = _build_requests_session()
+    return session
+
+
+def _post_json(endpoint: str, headers: Dict[str, str], payload: Dict):
+    """POST a pre-encoded JSON body (headers already carry Content-Type: application/json)."""
+    body = _json_dumps(payload)
+    if _HTTPX_CLIENT is not None:
+        return _HTTPX_CLIENT.post(endpoint, headers=headers, content=body, timeout=60)
+    return _session().post(endpoint, headers=headers, data=body, timeout=60)
+
 # ---------------------------
 # Utilities
 # ---------------------------
 
+_LOG_BUF: List[str] = []
+_LOG_LAST_FLUSH = 0.0
+_LOG_FLUSH_SECS = 0.5
+_LOG_FLUSH_LINES = 20
+_LOG_LOCK = threading.Lock()
+_LOG_TIMER: Optional[threading.Timer] = None
+
+
+def _flush_log():
+    global _LOG_LAST_FLUSH, _LOG_TIMER
+    with _LOG_LOCK:
+        _LOG_LAST_FLUSH = time.monotonic()
+        if _LOG_TIMER is not None:
+            _LOG_TIMER.cancel()
+            _LOG_TIMER = None
+        if not _LOG_BUF:
+            return
+        text = "\n".join(_LOG_BUF)
+        _LOG_BUF.clear()
+        # print under the lock so concurrent flushes can't interleave batches out of order
+        try:
+            print(text)
+        except Exception:
+            # last-resort fallback if stdout was messed with
+            import sys
+            try:
+                (sys.__stdout__ or sys.stdout).write(text + "\n")
+            except Exception:
+                pass
+
+atexit.register(_flush_log)
+
+
 def log(msg: str, cb: Optional[Callable[[str], None]] = None):
     if cb:
         try:
@@ -25,128 +116,319 @@ def log(msg: str, cb: Optional[Callable[[str], None]] = None):
             return
         except Exception:
             pass
-    try:
-        print(msg)
-    except Exception:
-        # last-resort fallback if stdout was messed with
-        import sys
-        try:
-            (sys.__stdout__ or sys.stdout).write(str(msg) + "\n")
-        except Exception:
-            pass
+    # stdout is buffered: flushing on every progress line is slow on Windows/Streamlit
+    global _LOG_TIMER
+    with _LOG_LOCK:
+        _LOG_BUF.append(str(msg))
+        flush_now = len(_LOG_BUF) >= _LOG_FLUSH_LINES or time.monotonic() - _LOG_LAST_FLUSH > _LOG_FLUSH_SECS
+        if not flush_now and _LOG_TIMER is None:
+            # No later line may come (e.g. "Updating …" then a long wait): flush on a timer too
+            _LOG_TIMER = threading.Timer(_LOG_FLUSH_SECS, _flush_log)
+            _LOG_TIMER.daemon = True
+            _LOG_TIMER.start()
+    if flush_now:
+        _flush_log()
+
+
+_PRODUCTS_SELECTION = """
+        pageInfo { hasNextPage endCursor }
+        edges {
+          node {
+            id
+            variants(first: 100) {
+              edges { node { id sku inventoryItem { id } } }
+            }
+          }
+        }"""
 
 
-def _fetch_products_variants(
+@functools.lru_cache(maxsize=32)
+def _product_type_filter(product_types: Tuple[str, ...]) -> str:
+    return " OR ".join([f"product_type:'{ptype}'" for ptype in product_types])
+
+
+def _products_args(product_types: Tuple[str, ...], date_filter: str) -> str:
+    """
+    Search/sort arguments for one products connection, newest first. `date_filter` is a
+    space-prefixed search fragment such as " created_at:>'2024-01-01T00:00:00Z'".
+    """
+    if product_types:
+        return f'query: "({_product_type_filter(product_types)}){date_filter} sort:created_at-desc"'
+    return f'query: "{date_filter.strip()}", sortKey:CREATED_AT, reverse:true'
+
+
+@functools.lru_cache(maxsize=32)
+def _products_query(product_types: Tuple[str, ...], date_filter: str) -> str:
+    """Single products + variants page query. Pass product_types as a tuple (cache key)."""
+    args = _products_args(product_types, date_filter)
+    return f"""
+    query($after:String) {{
+      products(first: {MAPPING_PAGE_SIZE}, {args}, after: $after) {{{_PRODUCTS_SELECTION}
+      }}
+    }}
+    """
+
+
+@functools.lru_cache(maxsize=128)
+def _aliased_products_query(product_types: Tuple[str, ...], date_filters: Tuple[str, ...]) -> str:
+    """
+    One document paging several independent created_at windows at once:
+    alias w<i> reads the page after $after<i> of date_filters[i].
+    Cached, since every round of a build re-requests the same window groups.
+    """
+    var_decl = ", ".join(f"$after{i}:String" for i in range(len(date_filters)))
+    fields = "\n".join(
+        f"      w{i}: products(first: {MAPPING_PAGE_SIZE}, {_products_args(product_types, f)}, "
+        f"after: $after{i}) {{{_PRODUCTS_SELECTION}\n      }}"
+        for i, f in enumerate(date_filters)
+    )
+    return f"""
+    query({var_decl}) {{
+{fields}
+    }}
+    """
+
+
+def _rows_from_edges(edges: List[Dict]) -> List[Dict]:
+    rows = []
+    for e in edges:
+        pid = e["node"]["id"]
+        for ve in e["node"]["variants"]["edges"]:
+            v = ve["node"]
+            inv_item = v.get("inventoryItem")
+            if not inv_item or not inv_item.get("id"):
+                continue
+            rows.append({
+                "product_id": pid,
+                "variant_id": v["id"],
+                "sku": v["sku"],
+                "inventory_item_id": inv_item["id"]
+            })
+    return rows
+
+
+def _fetch_windows_batched(
+    endpoint: str,
+    headers: Dict[str, str],
+    product_types: Optional[List[str]],
+    windows: List[str],
+    progress: Optional[Callable[[str], None]],
+) -> List[Dict]:
+    """
+    Page every window to the end. Each request carries the next page of up to
+    MAPPING_ALIASES_PER_QUERY windows as aliases, with MAPPING_FETCH_WORKERS
+    requests in flight; pacing comes from the shared leaky bucket.
+    """
+    results: List[List[Dict]] = [[] for _ in windows]
+    types_key = tuple(product_types or ())
+
+    def fetch_group(group):
+        query = _aliased_products_query(types_key, tuple(windows[n] for n, _ in group))
+        variables = {f"after{i}": cursor for i, (_, cursor) in enumerate(group)}
+        _BUCKET.acquire(MAPPING_PAGE_COST_ESTIMATE * len(group))
+        data = gql_with_retry(endpoint, headers, query, variables)
+        out = []
+        for i, (n, _) in enumerate(group):
+            conn = data["data"][f"w{i}"]
+            nxt = conn["pageInfo"]["endCursor"] if conn["pageInfo"]["hasNextPage"] else None
+            out.append((n, _rows_from_edges(conn["edges"]), nxt))
+        return out
+
+    pending = [(n, None) for n in range(len(windows))]
+    request_count = 0
+    with ThreadPoolExecutor(max_workers=MAPPING_FETCH_WORKERS) as pool:
+        while pending:
+            groups = [pending[i:i + MAPPING_ALIASES_PER_QUERY]
+                      for i in range(0, len(pending), MAPPING_ALIASES_PER_QUERY)]
+            pending = []
+            # progress stays on this thread: Streamlit callbacks can't run in workers
+            for fut in as_completed([pool.submit(fetch_group, g) for g in groups]):
+                for n, rows, nxt in fut.result():
+                    results[n].extend(rows)
+                    if nxt:
+                        pending.append((n, nxt))
+            request_count += len(groups)
+            if progress:
+                progress(f"… fetched {sum(len(r) for r in results)} variants so far "
+                         f"({request_count} requests, {len(pending)} windows open)")
+
+    return [row for rows in results for row in rows]
+
+
+def _fetch_pages(
     endpoint: str,
     headers: Dict[str, str],
+    query_str: str,
+    progress: Optional[Callable[[str], None]],
+    known_variant_ids=None,
+) -> List[Dict]:
+    """
+    Walk every page of `query_str`. Stops early if a known variant is found.
+
+    Page N+1 is fetched on a single prefetch thread while page N is parsed.
+    Early-stop runs only prefetch once a page came back clean, so a stop never
+    wastes a request.
+    """
+    all_rows: List[Dict] = []
+    page_count = 0
+    page_cost = MAPPING_PAGE_COST_ESTIMATE
+    stop_early = False
+    # A Bloom filter can false-positive: only stop after a run of consecutive hits
+    confirm = 1 if isinstance(known_variant_ids, (set, frozenset)) else KNOWN_IDS_BLOOM_CONFIRM
+    held: List[Dict] = []  # hits awaiting confirmation
+
+    def fetch(cursor, cost):
+        _BUCKET.acquire(cost)
+        # no progress callback here: Streamlit callbacks can't run in workers
+        return gql_with_retry(endpoint, headers, query_str, {"after": cursor})
+
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+    try:
+        pending = prefetcher.submit(fetch, None, page_cost)
+        while pending is not None:
+            data = pending.result()
+            pending = None
+            products = data["data"]["products"]
+            page_count += 1
+            page_cost = ((data.get("extensions") or {}).get("cost") or {}).get("actualQueryCost") or page_cost
+            page_info = products["pageInfo"]
+            next_cursor = page_info["endCursor"] if page_info["hasNextPage"] else None
+            if next_cursor and not known_variant_ids:
+                pending = prefetcher.submit(fetch, next_cursor, page_cost)
+
+            for e in products["edges"]:
+                pid = e["node"]["id"]
+                for ve in e["node"]["variants"]["edges"]:
+                    v = ve["node"]
+                    inv_item = v.get("inventoryItem")
+                    if not inv_item or not inv_item.get("id"):
+                        continue
+                    vid = v["id"]
+                    row = {
+                        "product_id": pid,
+                        "variant_id": vid,
+                        "sku": v["sku"],
+                        "inventory_item_id": inv_item["id"]
+                    }
+
+                    if known_variant_ids and vid in known_variant_ids:
+                        held.append(row)
+                        if len(held) >= confirm:
+                            stop_early = True
+                            if progress:
+                                progress(f"🛑 Early stop after {page_count} pages — first known variant {held[0]['variant_id']} found.")
+                            break
+                        continue
+
+                    all_rows.extend(held)  # an unconfirmed hit was a false positive
+                    held.clear()
+                    all_rows.append(row)
+
+                if stop_early:
+                    break
+
+            if stop_early or not next_cursor:
+                break
+            if pending is None:
+                pending = prefetcher.submit(fetch, next_cursor, page_cost)
+            if progress:
+                progress(f"… fetched {len(all_rows)} variants so far (page {page_count}, cost {page_cost})")
+    finally:
+        prefetcher.shutdown(wait=False, cancel_futures=True)
+
+    if not stop_early:
+        all_rows.extend(held)
+    return all_rows
+
+
+def _created_at_windows(days_back: Optional[int], shards: int) -> List[str]:
+    """
+    Split the catalogue into `shards` disjoint created_at filters, newest first.
+    The oldest window is open-ended (or bounded by days_back) so nothing is missed.
+    """
+    fmt = "%Y-%m-%dT%H:%M:%SZ"
+    now = datetime.utcnow()
+    span = timedelta(days=days_back or MAPPING_FETCH_WINDOW_DAYS)
+    bounds = [(now - span * k / shards).strftime(fmt) for k in range(1, shards)]
+
+    windows = [f" created_at:>'{bounds[0]}'"]
+    for newer, older in zip(bounds, bounds[1:]):
+        windows.append(f" created_at:>'{older}' created_at:<='{newer}'")
+    oldest = f" created_at:<='{bounds[-1]}'"
+    if days_back:
+        oldest += f" created_at:>'{(now - span).strftime(fmt)}'"
+    windows.append(oldest)
+    return windows
+
+
+def _fetch_products_variants(
+    profile: "StoreProfile",
     product_types: Optional[List[str]],
     progress: Optional[Callable[[str], None]],
-    known_variant_ids: Optional[set] = None,
+    known_variant_ids=None,
     days_back: Optional[int] = None
 ) -> List[Dict]:
     """
     Fetch products + variants, optionally filtered by created_at in the last X days.
     Stops early if known_variant_ids is provided and a known variant is found.
+
+    Full builds (no known_variant_ids) page MAPPING_FETCH_WINDOWS created_at
+    windows concurrently via aliased queries; early-stop runs stay serial.
     """
+    endpoint, headers = profile.endpoint, profile.headers
+    if known_variant_ids is None and MAPPING_FETCH_WINDOWS > 1:
+        windows = _created_at_windows(days_back, MAPPING_FETCH_WINDOWS)
+        return _fetch_windows_batched(endpoint, headers, product_types, windows, progress)
+
     cutoff_filter = ""
     if days_back is not None and days_back > 0:
         cutoff_date = (datetime.utcnow() - timedelta(days=days_back)).strftime("%Y-%m-%dT%H:%M:%SZ")
         cutoff_filter = f" created_at:>'{cutoff_date}'"
 
-    all_rows: List[Dict] = []
-    after_cursor = None
-    page_count = 0
-    stop_early = False
+    return _fetch_pages(endpoint, headers, _products_query(tuple(product_types or ()), cutoff_filter),
+                        progress, known_variant_ids)
 
-    if product_types:
-        product_filter = " OR ".join([f"product_type:'{ptype}'" for ptype in product_types])
-        query_str = f"""
-        query($after:String) {{
-          products(first: 100, query: "({product_filter}){cutoff_filter} sort:created_at-desc", after: $after) {{
-            pageInfo {{ hasNextPage }}
-            edges {{
-              cursor
-              node {{
-                id
-                variants(first: 100) {{
-                  edges {{ node {{ id sku inventoryItem {{ id }} }} }}
-                }}
-              }}
-            }}
-          }}
-        }}
-        """
-    else:
-        query_str = f"""
-        query($after:String) {{
-          products(first: 100, query: "{cutoff_filter.strip()}", sortKey:CREATED_AT, reverse:true, after: $after) {{
-            pageInfo {{ hasNextPage }}
-            edges {{
-              cursor
-              node {{
-                id
-                variants(first: 100) {{
-                  edges {{ node {{ id sku inventoryItem {{ id }} }} }}
-                }}
-              }}
-            }}
-          }}
-        }}
-        """
-
-    while True:
-        data = gql_with_retry(endpoint, headers, query_str, {"after": after_cursor}, progress=progress)
-        edges = data["data"]["products"]["edges"]
-        page_count += 1
 
-        for e in edges:
-            pid = e["node"]["id"]
-            for ve in e["node"]["variants"]["edges"]:
-                v = ve["node"]
-                inv_item = v.get("inventoryItem")
-                if not inv_item or not inv_item.get("id"):
-                    continue
-                vid = v["id"]
-
-                if known_variant_ids and vid in known_variant_ids:
-                    stop_early = True
-                    if progress:
-                        progress(f"🛑 Early stop after {page_count} pages — first known variant {vid} found.")
-                    break
 
-                all_rows.append({
-                    "product_id": pid,
-                    "variant_id": vid,
-                    "sku": v["sku"],
-                    "inventory_item_id": inv_item["id"]
-                })
+def build_headers(access_token: str) -> Dict[str, str]:
+    return {"Content-Type": "application/json", "X-Shopify-Access-Token": access_token}
 
-            if stop_early:
-                break
 
-        if stop_early:
-            break
+@dataclass(frozen=True, slots=True)
+class StoreProfile:
+    """
+    One store's settings, resolved once when STORE_PROFILES is loaded.
+    `endpoint` and `headers` are derived here so runs don't rebuild them.
+    """
+    shop_url: str
+    access_token: str = field(repr=False)
+    map_csv: str = ""
+    default_sku_prefix: str = ""
+    default_product_types: Tuple[str, ...] = ()
+    location_name: Optional[str] = None
+    endpoint: str = field(init=False)
+    headers: Dict[str, str] = field(init=False, repr=False)
 
-        if data["data"]["products"]["pageInfo"]["hasNextPage"]:
-            after_cursor = edges[-1]["cursor"]
-            time.sleep(0.6)
-            if progress:
-                progress(f"… fetched {len(all_rows)} variants so far (page {page_count})")
-        else:
-            break
+    def __post_init__(self):
+        object.__setattr__(self, "endpoint", f"https://{self.shop_url}/admin/api/{API_VERSION}/graphql.json")
+        object.__setattr__(self, "headers", build_headers(self.access_token))
 
-    return all_rows
 
+_SKU_BASE = "BY102"  # only this product line has translatable SKUs
+_SKU_RE = re.compile(rf"^({_SKU_BASE})-([^-]+)-([^-]+)-")
+_STORE_MAP_RE = re.compile(r"shopify_inventory_map_([a-z0-9_-]+)\.csv$", re.I)
+_SHEET_VALIDATE_RE = re.compile(r"shopify_inventory_map_([a-z0-9]+)_(\d+)\.csv")
 
 
-def build_headers(access_token: str) -> Dict[str, str]:
-    return {"Content-Type": "application/json", "X-Shopify-Access-Token": access_token}
+@functools.lru_cache(maxsize=32)
+def _split_re(store: str) -> "re.Pattern[str]":
+    return re.compile(rf"shopify_inventory_map_{re.escape(store)}_(\d+)\.csv$", re.I)
 
 
 def translate_sku(messy_sku: str) -> Optional[str]:
     if not isinstance(messy_sku, str):
         return None
-    m = re.match(r"^(BY102)-([^-]+)-([^-]+)-", messy_sku)
+    m = _SKU_RE.match(messy_sku)
     if not m:
         return None
     base, size_raw, colour_raw = m.groups()
@@ -156,39 +438,75 @@ def translate_sku(messy_sku: str) -> Optional[str]:
         return f"{base}{colour}{size}"
     return None
 
+
+def translate_sku_series(skus: pd.Series) -> pd.Series:
+    """
+    Vectorized translate_sku: one regex pass plus map() lookups.
+    Untranslatable SKUs come back as NaN.
+    """
+    parts = skus.str.extract(_SKU_RE.pattern)
+    size = parts[1].map(size_map)
+    colour = parts[2].map(colour_map)
+    out = parts[0] + colour + size  # NaN-propagating
+    return out.where((size != "") & (colour != ""))
+
 # --------------------------- Latest Helpers ---------------------------
-import glob
 
 def _store_from_map_csv(map_csv_path: str) -> Optional[str]:
     """
     utils/shopify_inventory_map_spoofy.csv -> spoofy
     """
-    m = re.search(r"shopify_inventory_map_([a-z0-9_-]+)\.csv$", map_csv_path, re.I)
+    m = _STORE_MAP_RE.search(map_csv_path)
     return m.group(1) if m else None
 
-def _latest_split_csv_for_store(store: str, base_dir: Optional[str] = None) -> Optional[str]:
-    """
-    Find utils/shopify_inventory_map_<store>_<N>.csv with the highest N.
-    If none exist, return path for _1 (so we can create it).
-    """
+def _split_search_dir(base_dir: Optional[str] = None) -> str:
     base = base_dir or os.path.dirname(os.path.abspath(__file__))
     # Usually your files are under utils/, so anchor there if present
     utils_dir = os.path.join(base, "utils")
-    search_dir = utils_dir if os.path.isdir(utils_dir) else base
+    return utils_dir if os.path.isdir(utils_dir) else base
+
+
+@functools.lru_cache(maxsize=64)
+def _scan_split_dir(store: str, search_dir: str, mtime_ns: int) -> Tuple[int, Optional[str]]:
+    # mtime_ns is only part of the cache key: adding/removing a split file bumps it
+    split_re = _split_re(store)
+    prefix = f"shopify_inventory_map_{store}_"
+    max_version, max_path = 0, None
+    with os.scandir(search_dir) as it:
+        for entry in it:
+            name = entry.name
+            if not (name.startswith(prefix) and name.endswith(".csv")):
+                continue
+            m = split_re.search(name)
+            if m and int(m.group(1)) > max_version:
+                max_version, max_path = int(m.group(1)), entry.path
+    return max_version, max_path
 
-    pattern = os.path.join(search_dir, f"shopify_inventory_map_{store}_*.csv")
-    candidates = []
-    for p in glob.glob(pattern):
-        m = re.search(rf"shopify_inventory_map_{store}_(\d+)\.csv$", os.path.basename(p), re.I)
-        if m:
-            candidates.append((int(m.group(1)), p))
 
-    if not candidates:
-        # default to _1 in the utils/ folder (or base if utils missing)
-        return os.path.join(search_dir, f"shopify_inventory_map_{store}_1.csv")
+def _scan_split_csvs(
+    store: str, base_dir: Optional[str] = None, search_dir: Optional[str] = None
+) -> Tuple[int, Optional[str]]:
+    """
+    Single os.scandir pass over the split folder -> (max_version, max_path).
+    (0, None) when the store has no split CSVs yet or the folder is missing.
+    Memoized per directory mtime. `search_dir` scans that exact folder instead of
+    resolving one from `base_dir`.
+    """
+    search_dir = search_dir or _split_search_dir(base_dir)
+    try:
+        mtime_ns = os.stat(search_dir).st_mtime_ns
+    except OSError:
+        return 0, None
+    return _scan_split_dir(store, search_dir, mtime_ns)
 
-    candidates.sort(key=lambda t: t[0])
-    return candidates[-1][1]
+
+def _latest_split_csv_for_store(store: str, base_dir: Optional[str] = None) -> Optional[str]:
+    """
+    Find utils/shopify_inventory_map_<store>_<N>.csv with the highest N.
+    If none exist, return path for _1 (so we can create it).
+    """
+    _, latest = _scan_split_csvs(store, base_dir)
+    return latest or os.path.join(_split_search_dir(base_dir), f"shopify_inventory_map_{store}_1.csv")
 
 # ===== Rotation + Registry helpers =====
 def _sheet_sources_json_path() -> str:
@@ -206,17 +524,15 @@ def _persist_new_sheet_id(store: str, new_sheet_id: str):
     """
     json_path = _sheet_sources_json_path()
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(json_path, "rb") as f:
+            data = _json_loads(f.read())
     except FileNotFoundError:
         data = {}
 
     data.setdefault(store, [])
     if new_sheet_id not in data[store]:
         data[store].append(new_sheet_id)
-
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+        _atomic_write_json(json_path, data)
 
     # keep in-memory constant in sync for this process
     if store not in SHEET_SOURCES:
@@ -318,6 +634,49 @@ def _rotate_google_targets_if_needed(
     return new_sheet_id, new_tab_title
 
 
+_SHEETS_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sheets")
+_SHEETS_APPEND_RETRIES = 3
+atexit.register(_SHEETS_EXECUTOR.shutdown, wait=True)
+
+
+def _submit_sheet_append(ws, values, label: str, pending: Optional[list] = None) -> None:
+    """
+    Append rows to a sheet tab, retrying transient failures; the last failure raises.
+    With a per-run `pending` list the append runs on the background executor and its
+    future goes into that list (see wait_for_sheet_appends); without one it runs inline.
+    """
+    def push():
+        for attempt in range(_SHEETS_APPEND_RETRIES):
+            try:
+                ws.append_rows(values, value_input_option="RAW", insert_data_option="INSERT_ROWS")
+                return
+            except Exception as e:
+                if attempt + 1 == _SHEETS_APPEND_RETRIES:
+                    raise RuntimeError(f"Google Sheet append of {len(values)} row(s) to {label} failed: {e}") from e
+                time.sleep(2 ** attempt)
+    if pending is None:
+        push()
+    else:
+        pending.append(_SHEETS_EXECUTOR.submit(push))
+
+
+def wait_for_sheet_appends(pending: list, progress: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Block until this run's queued Sheets appends finish. Returns the failure messages
+    (also logged): those rows are in the split CSVs but not the sheet, so the next
+    Google Sheets re-download would drop them until they are re-appended.
+    """
+    errors = []
+    while pending:
+        try:
+            pending.pop(0).result()
+        except Exception as e:
+            errors.append(str(e))
+    for msg in errors:
+        log(f"[ERROR] {msg} — re-append these rows before the next sheet refresh", progress)
+    return errors
+
+
 def _append_rows_csv_and_gsheet(
     new_rows: list[dict],
     store: str,
@@ -327,14 +686,19 @@ def _append_rows_csv_and_gsheet(
     google_client: gspread.Client,
     progress: Callable[[str], None],
     hard_size_threshold_mb: float,
+    pending: Optional[list] = None,
 ) -> None:
     """Appends new rows to latest split file and sheet, and creates new one if too big."""
     from utils.utils_io import save_csv_append, get_csv_size_mb, create_new_gsheet_tab
 
+    # Fixed column order shared by the CSV and the sheet (dict order can drift between rows)
+    cols = list(new_rows[0].keys()) if new_rows else MAP_COLUMNS
+    values = [[r.get(c, "") for c in cols] for r in new_rows]
+
     # Step 1: Determine current latest CSV
-    current_index = 1
-    while os.path.exists(f"{store_split_prefix}_{current_index}.csv"):
-        current_index += 1
+    split_dir = os.path.dirname(os.path.abspath(store_split_prefix))
+    max_version, _ = _scan_split_csvs(store, search_dir=split_dir)
+    current_index = max_version + 1
     latest_csv = f"{store_split_prefix}_{current_index - 1}.csv"
     latest_size = get_csv_size_mb(latest_csv)
     progress(f"[INFO] Latest CSV for store '{store}' is {latest_csv} ({latest_size:.2f} MB)")
@@ -344,7 +708,7 @@ def _append_rows_csv_and_gsheet(
         progress(f"[HARD] {latest_csv} is {latest_size:.2f} MB → ⛔ Creating a new Google Sheet tab")
         current_index += 1
         new_csv = f"{store_split_prefix}_{current_index}.csv"
-        save_csv_append(new_csv, new_rows)
+        save_csv_append(new_csv, new_rows, columns=cols)
         progress(f"✅ Created new CSV: {new_csv}")
 
         # Create new sheet tab
@@ -352,24 +716,22 @@ def _append_rows_csv_and_gsheet(
             parent_sheet_id = sheet_ids[store]["parent_sheet_id"]
             new_tab_title = os.path.basename(new_csv)
             sheet = google_client.open_by_key(parent_sheet_id)
-            sheet.add_worksheet(title=new_tab_title, rows="1000", cols="30")
+            ws = sheet.add_worksheet(title=new_tab_title, rows="1000", cols="30")
             sheet_ids[store][f"sheet_{current_index}"] = new_tab_title
             progress(f"✅ Created new tab '{new_tab_title}' in Google Sheet")
 
             # Save updated JSON map
-            with open(sheet_json_path, "w", encoding="utf-8") as f:
-                json.dump(sheet_ids, f, indent=2)
+            _atomic_write_json(sheet_json_path, sheet_ids)
             progress("✅ Updated shopify_sheet_ids.json with new sheet tab")
 
-            # Now append rows
-            ws = sheet.worksheet(new_tab_title)
-            ws.append_rows([list(row.values()) for row in new_rows])
-            progress(f"✅ Appended {len(new_rows)} row(s) to new tab '{new_tab_title}'")
+            # Now append rows (add_worksheet already returned the tab; no extra lookup)
+            _submit_sheet_append(ws, values, new_tab_title, pending)
+            progress(f"✅ Queued {len(new_rows)} row(s) for new tab '{new_tab_title}'")
         else:
             progress(f"[ERROR] No sheet ID found for store: {store}")
     else:
         # No overflow, just append to existing CSV and sheet
-        save_csv_append(latest_csv, new_rows)
+        save_csv_append(latest_csv, new_rows, columns=cols)
         progress(f"✅ Appended {len(new_rows)} row(s) to existing CSV: {latest_csv}")
 
         # Append to existing Google Sheet tab
@@ -377,8 +739,8 @@ def _append_rows_csv_and_gsheet(
             latest_tab = os.path.basename(latest_csv)
             sheet = google_client.open_by_key(sheet_ids[store]["parent_sheet_id"])
             ws = sheet.worksheet(latest_tab)
-            ws.append_rows([list(row.values()) for row in new_rows])
-            progress(f"✅ Appended {len(new_rows)} row(s) to Google Sheet tab '{latest_tab}'")
+            _submit_sheet_append(ws, values, latest_tab, pending)
+            progress(f"✅ Queued {len(new_rows)} row(s) for Google Sheet tab '{latest_tab}'")
         else:
             progress(f"[ERROR] No sheet ID found for store: {store}")
 
@@ -400,27 +762,76 @@ def log_file_size_alert(path: str, label: str, progress: Optional[Callable[[str]
 
 
 # ---- Throttling helpers ----
-def _throttle_wait_from_cost(data, default_wait=2.0):
+def _throttle_wait_from_cost(data, default_wait=2.0, needed_points=100):
+    """
+    Seconds until the bucket holds enough points for this query:
+    (needed - available) / restoreRate, with needed taken from requestedQueryCost.
+    """
     try:
-        cost = data.get("extensions", {}).get("cost", {})
-        ts = cost.get("throttleStatus", {})
-        avail = float(ts.get("currentlyAvailable", 0))
-        restore = float(ts.get("restoreRate", 0))
-        if avail <= 0 and restore > 0:
-            return max(2.0, 1.5 * (1.0 / restore) * 10)
-        return 0.5
-    except Exception:
+        cost = data["extensions"]["cost"]
+        ts = cost["throttleStatus"]
+        needed = cost.get("requestedQueryCost") or needed_points
+        avail = ts["currentlyAvailable"]
+        restore = ts["restoreRate"]
+        if avail >= needed:
+            return 0.0
+        if restore <= 0:
+            return default_wait
+        return max(0.5, (needed - avail) / restore)
+    except (KeyError, TypeError, AttributeError):
         return default_wait
 
 
+class LeakyBucket:
+    """
+    Client-side mirror of Shopify's GraphQL cost bucket.
+    Refilled from every response's extensions.cost.throttleStatus; acquire()
+    sleeps only as long as needed for `cost` points to be available.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.available: Optional[float] = None  # unknown until the first response
+        self.maximum = 0.0
+        self.restore_rate = 0.0
+        self._stamp = time.monotonic()
+
+    def update(self, data) -> None:
+        try:
+            ts = data["extensions"]["cost"]["throttleStatus"]
+            available = float(ts["currentlyAvailable"])
+            maximum = float(ts["maximumAvailable"])
+            restore = float(ts["restoreRate"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            self.available, self.maximum, self.restore_rate = available, maximum, restore
+            self._stamp = time.monotonic()
+
+    def acquire(self, cost: float) -> None:
+        with self._lock:
+            if self.available is None or self.restore_rate <= 0:
+                return
+            now = time.monotonic()
+            self.available = min(self.maximum, self.available + (now - self._stamp) * self.restore_rate)
+            self._stamp = now
+            wait = max(0.0, (cost - self.available) / self.restore_rate)
+            self.available -= cost
+        if wait:
+            time.sleep(wait)
+
+
+_BUCKET = LeakyBucket()
+
+
 def gql_with_retry(endpoint: str, headers: Dict[str, str], query: str, variables: Dict = None,
                    max_retries: int = 8, progress: Optional[Callable[[str], None]] = None):
     attempt = 0
     backoff = 1.0
     while True:
-        r = requests.post(endpoint, headers=headers, json={"query": query, "variables": variables or {}}, timeout=60)
+        r = _post_json(endpoint, headers, {"query": query, "variables": variables or {}})
         try:
-            data = r.json()
+            data = _json_loads(r.content)
         except Exception:
             raise RuntimeError(f"Non-JSON response ({r.status_code}): {r.text[:300]}")
         if "errors" in data:
@@ -434,6 +845,7 @@ def gql_with_retry(endpoint: str, headers: Dict[str, str], query: str, variables
                 backoff = min(backoff * 2, 10.0)
                 continue
             raise RuntimeError(f"GraphQL Errors: {json.dumps(data['errors'], indent=2)}")
+        _BUCKET.update(data)
         return data
 
 
@@ -485,19 +897,100 @@ def get_product_ids_for_types(endpoint: str, headers: Dict[str, str], product_ty
     return found
 
 
-def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
+# ---- TTL disk cache for rarely-changing lookups ----
+def _cache_path(kind: str, endpoint: str, headers: Dict[str, str], *args, ext: str = "json") -> str:
+    # Token is part of the key so rotated/invalid credentials never hit a stale entry
+    raw = json.dumps([endpoint, headers.get("X-Shopify-Access-Token", ""), *args])
+    key = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SHOPIFY_CACHE_DIR, f"{kind}_{key}.{ext}")
+
+
+def _cache_load(path: str, ttl: float):
+    try:
+        with open(path, "rb") as f:
+            payload = _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if time.time() - payload.get("fetched_at", 0) > ttl:
+        return None
+    return payload.get("value")
+
+
+def _cache_store(path: str, value) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write_bytes(path, _json_dumps({"fetched_at": time.time(), "value": value}))
+    except OSError:
+        pass
+
+
+def cached_preflight(endpoint: str, headers: Dict[str, str], refresh: bool = False,
+                     progress: Optional[Callable[[str], None]] = None) -> Dict:
+    path = _cache_path("preflight", endpoint, headers)
+    shop = None if refresh else _cache_load(path, PREFLIGHT_CACHE_TTL)
+    if shop is None:
+        shop = preflight(endpoint, headers, progress=progress)
+        _cache_store(path, shop)
+    return shop
+
+
+def cached_location_gid(endpoint: str, headers: Dict[str, str], location_name: Optional[str],
+                        refresh: bool = False) -> str:
+    path = _cache_path("location", endpoint, headers, location_name)
+    gid = None if refresh else _cache_load(path, LOCATIONS_CACHE_TTL)
+    if gid is None:
+        gid = get_location_gid(endpoint, headers, location_name)
+        _cache_store(path, gid)
+    return gid
+
+
+def cached_product_ids_for_types(endpoint: str, headers: Dict[str, str], product_types: List[str],
+                                 refresh: bool = False) -> set:
+    """
+    Product-ID sets are stored one ID per line under a '# fetched_at=<epoch>' header.
+    """
+    if not product_types:
+        return set()
+    path = _cache_path("product_types", endpoint, headers, sorted(product_types), ext="txt")
+    if not refresh:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                first = f.readline().strip()
+                fetched_at = float(first.split("=", 1)[1]) if first.startswith("# fetched_at=") else 0.0
+                if time.time() - fetched_at <= PRODUCT_TYPES_CACHE_TTL:
+                    return {line.strip() for line in f if line.strip()}
+        except (OSError, ValueError):
+            pass
+
+    found = get_product_ids_for_types(endpoint, headers, product_types)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Atomic, so a crash mid-write can't leave a truncated (but fresh-looking) ID list
+        body = f"# fetched_at={time.time()}\n" + "".join(f"{pid}\n" for pid in found)
+        _atomic_write_bytes(path, body.encode("utf-8"))
+    except OSError:
+        pass
+    return found
+
+
+def ensure_mapping(profile: StoreProfile, map_csv_path: str,
                    product_types: Optional[List[str]],
                    progress: Optional[Callable[[str], None]] = None,
-                   days_back: Optional[int] = None) -> Tuple[int, int]:
+                   days_back: Optional[int] = None,
+                   sheet_appends: Optional[list] = None) -> Tuple[int, int, Optional[pd.DataFrame]]:
     """
     Ensure mapping CSV exists; if missing, build full (no date filter).
+    Background Sheets appends are queued on `sheet_appends` (the caller waits on them).
     If exists, append only NEW variants (by variant_id) using early stop and optional days_back filter.
 
+    Returns (total_after, added, mapping_df). mapping_df is the in-memory mapping when this
+    call already had it materialized (full build or new rows appended), else None.
+
     NEW: also append the same new rows to the latest split CSV file for this store:
          utils/shopify_inventory_map_<store>_<N>.csv
          and warn if that file passes 90/95/100 MB.
     """
-    cols = ["product_id", "variant_id", "sku", "inventory_item_id"]
+    cols = MAP_COLUMNS
 
     folder = os.path.dirname(map_csv_path)
     if folder:
@@ -510,10 +1003,18 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
     if not os.path.exists(map_csv_path):
         log(f"🆕 Mapping not found. Building full mapping → {map_csv_path}", progress)
         rows = _fetch_products_variants(
-            endpoint, headers, product_types, progress,
+            profile, product_types, progress,
             known_variant_ids=None, days_back=None
         )
-        pd.DataFrame(rows, columns=cols).to_csv(map_csv_path, index=False)
+        # Stream the CSV straight from the row dicts; the frame is only for the parquet cache + caller
+        with open(map_csv_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+            w = csv.DictWriter(f, fieldnames=cols, extrasaction="ignore")
+            w.writeheader()
+            w.writerows(rows)
+        rows_df = pd.DataFrame(rows, columns=cols)
+        _write_map_parquet(rows_df, map_csv_path)
+        _write_known_ids({r["variant_id"] for r in rows}, map_csv_path)
+        _record_mapping_product_types(map_csv_path, product_types, full_build=True)
 
         if latest_split_csv != map_csv_path:
             csv_path, gsheet_id = get_latest_split_csv_and_gsheet_for_store(store)
@@ -527,20 +1028,20 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
                 store=store,
                 google_sheet_id=gsheet_id,
                 progress=progress,
+                pending=sheet_appends,
             )
             log_file_size_alert(used_path, "split file", progress)
 
         log(f"✅ Mapping created with {len(rows)} variants.", progress)
-        return len(rows), len(rows)
+        return len(rows), len(rows), rows_df
 
 
     # ---------- Incremental append ----------
-    existing = pd.read_csv(map_csv_path, dtype=str)
-    known_ids = set(existing["variant_id"].astype(str)) if not existing.empty else set()
+    known_ids = _load_known_ids(map_csv_path)
     log(f"🔎 Checking for new variants (current count: {len(known_ids)})…", progress)
 
     new_rows = _fetch_products_variants(
-        endpoint, headers, product_types, progress,
+        profile, product_types, progress,
         known_variant_ids=known_ids, days_back=days_back
     )
 
@@ -555,10 +1056,19 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
             google_sheet_id=last_sheet_id,
             sheet_tab_name=get_sheet_tab_name_from_latest_split_csv(store),
             progress=progress,
+            pending=sheet_appends,
         )
 
         log(f"➕ Added {len(new_rows)} new variants to mapping.", progress)
 
+        # Keep the parquet cache and ID sidecar ahead of the merged CSV so this run sees the new variants
+        existing = _read_map(map_csv_path)
+        mapping_df = pd.concat([existing.astype(object), pd.DataFrame(new_rows, columns=cols)], ignore_index=True)
+        _write_map_parquet(mapping_df, map_csv_path)
+        if isinstance(known_ids, set):
+            _write_known_ids(known_ids | {r["variant_id"] for r in new_rows}, map_csv_path)
+        _record_mapping_product_types(map_csv_path, product_types, full_build=False)
+
         # Check if any mismatch with registered sheet/CSV (defensive)
         csv_path, gsheet_id = get_latest_split_csv_and_gsheet_for_store(store)
         validate_sheet_matches_csv(csv_path=csv_path, sheet_id=gsheet_id)
@@ -570,6 +1080,7 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
                 store=store,
                 google_sheet_id=gsheet_id,
                 progress=progress,
+                pending=sheet_appends,
             )
 
         # Always check the latest actual file size (even if append skipped)
@@ -577,10 +1088,203 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
 
 
     else:
+        mapping_df = None
         log("✅ No new variants found.", progress)
 
     total_after = len(known_ids) + len(new_rows)
-    return total_after, len(new_rows)
+    return total_after, len(new_rows), mapping_df
+
+
+# ---------------------------
+# Mapping storage helpers
+# ---------------------------
+
+MAP_COLUMNS = ["product_id", "variant_id", "sku", "inventory_item_id"]
+
+
+def _map_parquet_path(map_csv_path: str) -> str:
+    # ".v2": caches written before SKUs were typed as strings at parse time lost leading zeros
+    return map_csv_path + ".v2.parquet"
+
+
+def _write_map_parquet(df: pd.DataFrame, map_csv_path: str) -> None:
+    """
+    Persist the mapping as a zstd Parquet sibling of the CSV.
+    Best effort only: without pyarrow we simply keep using the CSV.
+    """
+    try:
+        df.to_parquet(_map_parquet_path(map_csv_path), engine="pyarrow", compression="zstd", index=False)
+    except Exception as e:
+        print(f"[WARN] Could not write mapping parquet cache: {e}")
+
+
+def _read_map_csv(map_csv_path: str) -> pd.DataFrame:
+    """
+    Typed read of the mapping CSV: every column is an ID string, so skip inference.
+    Types are fixed at parse time via Arrow's column_types (pandas' engine="pyarrow"
+    infers numbers first, turning SKU '00123' into '123').
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pv
+    except ImportError:
+        return pd.read_csv(map_csv_path, dtype=str)
+    with open(map_csv_path, "r", encoding="utf-8", newline="") as f:
+        names = next(csv.reader(f), [])
+    opts = pv.ConvertOptions(column_types={c: pa.string() for c in names}, strings_can_be_null=True)
+    tbl = pv.read_csv(map_csv_path, convert_options=opts)
+    return tbl.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+
+def _read_map(map_csv_path: str) -> pd.DataFrame:
+    """
+    Load the mapping, preferring the Parquet sibling when it is at least as new as the CSV.
+    Falls back to the CSV (and refreshes the Parquet copy) otherwise.
+    """
+    pq_path = _map_parquet_path(map_csv_path)
+    try:
+        if os.path.getmtime(pq_path) >= os.path.getmtime(map_csv_path):
+            return pd.read_parquet(pq_path, engine="pyarrow", dtype_backend="pyarrow", columns=MAP_COLUMNS)
+    except (OSError, ImportError, ValueError):
+        pass
+
+    df = _read_map_csv(map_csv_path)
+    if not df.empty:
+        _write_map_parquet(df, map_csv_path)
+    return df
+
+
+def _known_ids_path(map_csv_path: str) -> str:
+    return map_csv_path + ".ids.txt"
+
+
+def _write_known_ids(ids: set, map_csv_path: str) -> None:
+    """Atomically persist the known variant-ID set next to the mapping CSV, one ID per line."""
+    try:
+        _atomic_write_bytes(_known_ids_path(map_csv_path), "".join(f"{vid}\n" for vid in ids).encode("utf-8"))
+    except OSError as e:
+        print(f"[WARN] Could not write known-IDs sidecar: {e}")
+
+
+class VariantIdBloom:
+    """
+    Bloom filter over variant GIDs: ~10 bits per ID at a 1% false-positive rate,
+    versus ~100 bytes per str in a set. Supports add / in / len only.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = KNOWN_IDS_BLOOM_FP_RATE):
+        capacity = max(int(capacity), 1)
+        m = int(-capacity * np.log(fp_rate) / (np.log(2) ** 2))
+        self._m = max(m, 8)
+        self._k = max(1, round(self._m / capacity * np.log(2)))
+        self._bits = np.zeros((self._m + 7) // 8, dtype=np.uint8)
+        self._count = 0
+
+    def _positions(self, vid: str):
+        digest = hashlib.blake2b(vid.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._m for i in range(self._k)]
+
+    def add(self, vid: str) -> None:
+        for pos in self._positions(vid):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def __contains__(self, vid) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(vid))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def _load_known_ids(map_csv_path: str, use_bloom: Optional[bool] = None):
+    """
+    Known variant IDs from the plain-text sidecar when it is at least as new as the CSV;
+    otherwise rebuilt from the mapping (and the sidecar refreshed).
+
+    Mappings over KNOWN_IDS_BLOOM_MIN_MB (or use_bloom=True) are streamed into a
+    VariantIdBloom instead; it isn't persisted.
+    """
+    if use_bloom is None:
+        use_bloom = _file_size_mb(map_csv_path) > KNOWN_IDS_BLOOM_MIN_MB
+    if use_bloom:
+        # mapping rows are at least ~60 bytes, so this over-sizes the filter slightly
+        bloom = VariantIdBloom(os.path.getsize(map_csv_path) // 60)
+        with open(map_csv_path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                bloom.add(row["variant_id"])
+        return bloom
+
+    path = _known_ids_path(map_csv_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(map_csv_path):
+            with open(path, "r", encoding="utf-8") as f:
+                return {line.rstrip("\n") for line in f if line.strip()}
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    ids = _load_known_variant_ids(map_csv_path)
+    _write_known_ids(ids, map_csv_path)
+    return ids
+
+
+def _load_known_variant_ids(path: str) -> set:
+    """Stream the mapping CSV and collect variant_id only; no other column is decoded."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return {row["variant_id"] for row in csv.DictReader(f)}
+
+
+def _meta_path(map_csv_path: str) -> str:
+    return map_csv_path + ".meta.json"
+
+
+def _map_csv_stamp(map_csv_path: str) -> Optional[Tuple[int, int]]:
+    """(st_mtime_ns, st_size) of the mapping CSV, or None if it is missing."""
+    try:
+        st_ = os.stat(map_csv_path)
+    except OSError:
+        return None
+    return st_.st_mtime_ns, st_.st_size
+
+
+def _mapping_product_types(map_csv_path: str) -> Optional[set]:
+    """
+    Product types the mapping is scoped to, or None if unscoped/unknown.
+    The meta only counts for the exact CSV it was recorded against: a rewritten
+    (e.g. re-merged) or different CSV reads as unscoped.
+    """
+    try:
+        with open(_meta_path(map_csv_path), "rb") as f:
+            meta = _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    stamp = _map_csv_stamp(map_csv_path)
+    if stamp is None or [meta.get("csv_mtime_ns"), meta.get("csv_size")] != list(stamp):
+        return None
+    types = meta.get("product_types")
+    return set(types) if types else None
+
+
+def _record_mapping_product_types(map_csv_path: str, product_types: Optional[List[str]], full_build: bool) -> None:
+    """
+    Track which product types the mapping covers. Incremental appends widen the
+    scope (union); any unscoped fetch, or unknown history, makes it unscoped.
+    """
+    types = set(product_types) if product_types else None
+    if types is not None and not full_build:
+        previous = _mapping_product_types(map_csv_path)
+        types = types | previous if previous is not None else None
+    stamp = _map_csv_stamp(map_csv_path)
+    try:
+        _atomic_write_json(_meta_path(map_csv_path), {
+            "product_types": sorted(types) if types else None,
+            "built_at": time.time(),
+            "csv_mtime_ns": stamp[0] if stamp else None,
+            "csv_size": stamp[1] if stamp else None,
+        })
+    except OSError as e:
+        print(f"[WARN] Could not write mapping meta: {e}")
 
 
 # ---------------------------   
@@ -588,30 +1292,16 @@ def ensure_mapping(endpoint: str, headers: Dict[str, str], map_csv_path: str,
 # ---------------------------
 
 def get_sheet_tab_name_from_latest_split_csv(store: str, base_dir: Optional[str] = None) -> Optional[str]:
-    import glob
-    base = base_dir or os.path.dirname(os.path.abspath(__file__))
-    utils_dir = os.path.join(base, "utils")
-    search_dir = utils_dir if os.path.isdir(utils_dir) else base
-
-    pattern = os.path.join(search_dir, f"shopify_inventory_map_{store}_*.csv")
-    candidates = []
-    for p in glob.glob(pattern):
-        m = re.search(rf"shopify_inventory_map_{store}_(\d+)\.csv$", os.path.basename(p), re.I)
-        if m:
-            candidates.append((int(m.group(1)), p))
-
-    if not candidates:
+    latest_version, _ = _scan_split_csvs(store, base_dir)
+    if not latest_version:
         raise ValueError(f"No split CSVs found for store '{store}' to infer tab name.")
-
-    candidates.sort(key=lambda t: t[0])
-    latest_version = candidates[-1][0]
     return f"shopify_inventory_map_{store}_{latest_version}"
 
 
 def validate_sheet_matches_csv(csv_path: str, sheet_id: str):
     # Just a sanity check to help during dev
     basename = os.path.basename(csv_path)
-    match = re.match(r"shopify_inventory_map_([a-z0-9]+)_(\d+)\.csv", basename)
+    match = _SHEET_VALIDATE_RE.match(basename)
     if not match:
         return
     store, version = match.group(1), int(match.group(2))
@@ -630,42 +1320,116 @@ def get_latest_split_csv_and_gsheet_for_store(store: str) -> tuple[str, Optional
     last_sheet_id = SHEET_SOURCES[store][-1] if store in SHEET_SOURCES else None
     return latest_csv, last_sheet_id
 
-def load_shared_stock_csv(path: str) -> Dict[str, int]:
+def _free_qty(col: pd.Series) -> np.ndarray:
+    """'free' column -> int64 array, blanks/junk as 0. Numeric columns skip the to_numeric pass."""
+    if not pd.api.types.is_numeric_dtype(col):
+        col = pd.to_numeric(col, errors="coerce")
+    if col.hasnans:
+        col = col.fillna(0)
+    return col.to_numpy(dtype="int64")
+
+
+def load_shared_stock_csv(path: str) -> pd.Series:
+    """
+    Load the shared stock CSV as an int64 'qty' Series indexed by stripped SKU.
+    Duplicate SKUs keep the last row, matching the old dict semantics.
+    """
     if not os.path.exists(path):
         raise FileNotFoundError(f"Stock CSV not found: {path}")
-    df = pd.read_csv(path, dtype=str)
-    cols = {c.lower(): c for c in df.columns}
+    header = pd.read_csv(path, nrows=0).columns
+    cols = {c.lower(): c for c in header}
     if "sku" not in cols or "free" not in cols:
-        raise ValueError(f"CSV must contain 'SKU' and 'free' columns. Found: {list(df.columns)}")
+        raise ValueError(f"CSV must contain 'SKU' and 'free' columns. Found: {list(header)}")
     sku_col, free_col = cols["sku"], cols["free"]
-    df = df[[sku_col, free_col]].copy()
-    df[sku_col] = df[sku_col].astype(str).str.strip()
-    df[free_col] = pd.to_numeric(df[free_col], errors="coerce").fillna(0).astype(int)
-    return dict(zip(df[sku_col], df[free_col]))
+    usecols = [sku_col, free_col]
+
+    if _file_size_mb(path) > SIZE_ALERT_MB:
+        # Large file: stream it so peak memory is one chunk, not the whole sheet
+        parts = []
+        for chunk in pd.read_csv(path, usecols=usecols, dtype={sku_col: "string"}, na_values=[""],
+                                 chunksize=STOCK_CSV_CHUNK_ROWS):
+            free = _free_qty(chunk[free_col])
+            parts.append(pd.Series(free, index=chunk[sku_col].astype(str).str.strip().to_numpy()))
+        stock = pd.concat(parts) if parts else pd.Series(dtype="int64")
+        return stock[~stock.index.duplicated(keep="last")].rename("qty")
+
+    stock = _read_stock_arrow(path, sku_col, free_col)
+    if stock is None:
+        # Let the C parser infer 'free' (numeric unless it holds junk) instead of str-for-all
+        df = pd.read_csv(path, usecols=usecols, dtype={sku_col: "string"}, na_values=[""])
+        stock = pd.Series(_free_qty(df[free_col]), index=df[sku_col].astype(str).str.strip().to_numpy(), name="qty")
+    return stock[~stock.index.duplicated(keep="last")]
+
+
+def _read_stock_arrow(path: str, sku_col: str, free_col: str) -> Optional[pd.Series]:
+    """
+    Common case: 'free' is integers/blanks, so Arrow's parser can type it directly.
+    The SKU column is typed as string at parse time (pandas' engine="pyarrow" infers first,
+    which turns '007' into '7'). None when pyarrow is missing or 'free' holds junk.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pv
+    except ImportError:
+        return None
+    opts = pv.ConvertOptions(include_columns=[sku_col, free_col],
+                             column_types={sku_col: pa.string(), free_col: pa.int64()})
+    try:
+        tbl = pv.read_csv(path, convert_options=opts)
+    except pa.ArrowInvalid:
+        return None
+    free = tbl.column(free_col).fill_null(0).to_numpy()
+    skus = tbl.column(sku_col).to_pandas().str.strip().to_numpy()
+    return pd.Series(free, index=skus, name="qty", dtype="int64")
+
+
+@functools.lru_cache(maxsize=8)
+def _set_on_hand_mutation(n: int) -> str:
+    """One document with n aliased inventorySetOnHandQuantities calls (m0..m{n-1})."""
+    params = ", ".join(f"$in{k}: InventorySetOnHandQuantitiesInput!" for k in range(n))
+    fields = "\n".join(
+        f"  m{k}: inventorySetOnHandQuantities(input: $in{k}) {{ userErrors {{ field message }} }}"
+        for k in range(n)
+    )
+    return f"mutation SetOnHand({params}) {{\n{fields}\n}}"
 
 
-def set_on_hand_quantities(endpoint: str, headers: Dict[str, str], batch_rows,
+def set_on_hand_quantities(endpoint: str, headers: Dict[str, str], batches,
                            location_gid: str, dry_run: bool,
                            progress: Optional[Callable[[str], None]] = None):
+    """
+    Push several batches in one request as aliased mutations.
+    Returns one (ok, user_errors) per batch; a single batch (list of row
+    dicts) is still accepted and gets a single tuple back.
+    """
+    single = bool(batches) and isinstance(batches[0], dict)
+    if single:
+        batches = [batches]
+
+    def result(per_batch):
+        return per_batch[0] if single else per_batch
+
     if dry_run:
-        return True, []
-
-    set_quantities = [
-        {"inventoryItemId": r["inventoryItemId"], "locationId": location_gid, "quantity": int(r["quantity"])}
-        for r in batch_rows
-    ]
-    mutation = """
-    mutation SetOnHand($input: InventorySetOnHandQuantitiesInput!) {
-      inventorySetOnHandQuantities(input: $input) {
-        userErrors { field message }
-      }
-    }"""
-    variables = {"input": {"reason": "correction", "setQuantities": set_quantities}}
+        return result([(True, [])] * len(batches))
+
+    variables = {
+        f"in{k}": {
+            "reason": "correction",
+            "setQuantities": [
+                {"inventoryItemId": r["inventoryItemId"], "locationId": location_gid, "quantity": int(r["quantity"])}
+                for r in batch_rows
+            ],
+        }
+        for k, batch_rows in enumerate(batches)
+    }
+    mutation = _set_on_hand_mutation(len(batches))
+
+    def fail(field_name, message):
+        return result([(False, [{"field": [field_name], "message": message}])] * len(batches))
 
     backoff = 1.0
     for attempt in range(1, RETRY_429_MAX + 1):
-        resp = requests.post(endpoint, headers=headers,
-                             json={"query": mutation, "variables": variables}, timeout=60)
+        resp = _post_json(endpoint, headers, {"query": mutation, "variables": variables})
 
         if resp.status_code == 429:
             wait = min(backoff, 10.0)
@@ -676,10 +1440,11 @@ def set_on_hand_quantities(endpoint: str, headers: Dict[str, str], batch_rows,
             continue
 
         try:
-            data = resp.json()
+            data = _json_loads(resp.content)
         except Exception:
-            return False, [{"field": ["network"], "message": f"Non-JSON response {resp.status_code}"}]
+            return fail("network", f"Non-JSON response {resp.status_code}")
 
+        _BUCKET.update(data)
         if "errors" in data:
             throttled = any((e.get("extensions", {}) or {}).get("code") == "THROTTLED" for e in data["errors"])
             if throttled and attempt < RETRY_429_MAX:
@@ -689,12 +1454,45 @@ def set_on_hand_quantities(endpoint: str, headers: Dict[str, str], batch_rows,
                 time.sleep(wait)
                 backoff = min(backoff * 2, 10.0)
                 continue
-            return False, [{"field": ["graphql"], "message": json.dumps(data["errors"])}]
+            return fail("graphql", json.dumps(data["errors"]))
+
+        per_batch = []
+        for k in range(len(batches)):
+            user_errors = ((data.get("data") or {}).get(f"m{k}") or {}).get("userErrors") or []
+            per_batch.append((len(user_errors) == 0, user_errors))
+        return result(per_batch)
 
-        user_errors = data["data"]["inventorySetOnHandQuantities"].get("userErrors") or []
-        return (len(user_errors) == 0), user_errors
+    return fail("retry", "Failed after retries due to throttling.")
 
-    return False, [{"field": ["retry"], "message": "Failed after retries due to throttling."}]
+
+def report_csv_bytes(report_df: pd.DataFrame) -> bytes:
+    """Serialize a report with pyarrow's C++ CSV writer (pandas fallback)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return report_df.to_csv(index=False).encode("utf-8")
+    sink = pa.BufferOutputStream()
+    pacsv.write_csv(pa.Table.from_pandas(report_df, preserve_index=False), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def _write_report(report_df: pd.DataFrame, filename: str) -> str:
+    """Write the report CSV, gzip-compressed past REPORT_GZIP_ROWS. Returns the path written."""
+    path = filename + ".gz" if len(report_df) > REPORT_GZIP_ROWS else filename
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        report_df.to_csv(path, index=False)  # compression inferred from .gz
+        return path
+    table = pa.Table.from_pandas(report_df, preserve_index=False)
+    if path.endswith(".gz"):
+        with pa.CompressedOutputStream(path, "gzip") as out:
+            pacsv.write_csv(table, out)
+    else:
+        pacsv.write_csv(table, path)
+    return path
 
 
 # ---------------------------
@@ -704,26 +1502,24 @@ def set_on_hand_quantities(endpoint: str, headers: Dict[str, str], batch_rows,
 def run_update(*, store: str, sku_prefix: Optional[str], product_types: Optional[List[str]],
                location_name: Optional[str], batch_size: int, map_csv: Optional[str],
                stock_csv_path: Optional[str], dry_run: bool, build_map: bool,
-               store_profiles: Dict[str, Dict],
+               store_profiles: Dict[str, StoreProfile],
                progress: Optional[Callable[[str], None]] = None,
                days_back: int = 7,
-               force_refresh_google_sheets: bool = False) -> Tuple[pd.DataFrame, Dict]:
+               force_refresh_google_sheets: bool = False,
+               invalidate_cache: bool = False) -> Tuple[pd.DataFrame, Dict]:
 
     start_ts = time.time()
     profile = store_profiles[store]
-    shop_url = profile["SHOP_URL"]
-    access_token = profile["ACCESS_TOKEN"]
-    map_csv = map_csv or profile["MAP_CSV"]
+    map_csv = map_csv or profile.map_csv
     stock_csv_path = stock_csv_path or STOCK_CSV_PATH
-    sku_prefix = profile["DEFAULT_SKU_PREFIX"] if sku_prefix is None else sku_prefix
-    product_types = product_types if product_types is not None else profile["DEFAULT_PRODUCT_TYPES"]
-    location_name = location_name if location_name is not None else profile.get("LOCATION_NAME")
+    sku_prefix = profile.default_sku_prefix if sku_prefix is None else sku_prefix
+    product_types = product_types if product_types is not None else list(profile.default_product_types)
+    location_name = location_name if location_name is not None else profile.location_name
 
-    graphql_endpoint = f"https://{shop_url}/admin/api/{API_VERSION}/graphql.json"
-    headers = build_headers(access_token)
+    graphql_endpoint, headers = profile.endpoint, profile.headers
 
     try:
-        shop_info = preflight(graphql_endpoint, headers)
+        shop_info = cached_preflight(graphql_endpoint, headers, refresh=invalidate_cache)
         log(f"✅ Connected to {shop_info.get('name')} ({shop_info.get('myshopifyDomain')})", progress)
     except Exception as e:
         msg = str(e)
@@ -746,29 +1542,38 @@ def run_update(*, store: str, sku_prefix: Optional[str], product_types: Optional
 
 
 
-    if build_map or not os.path.exists(map_csv):
-        total_after, added = ensure_mapping(graphql_endpoint, headers, map_csv, product_types, progress, days_back=days_back)
-        if build_map:
-            elapsed = round(time.time() - start_ts, 2)
-            return pd.DataFrame(), {
-                "message": f"Mapping built/updated. Total variants: {total_after}, added: {added}",
-                "updated": 0, "dry": 0, "errors": 0, "translated": 0,
-                "skipped": 0, "report_filename": "", "elapsed_secs": elapsed
-            }
-
-    total_after, added = ensure_mapping(graphql_endpoint, headers, map_csv, product_types, progress, days_back=days_back)
+    # ensure_mapping handles both the missing-CSV full build and the incremental append
+    sheet_appends: list = []  # this run's background Sheets appends (never shared across sessions)
+    total_after, added, mapping_df = ensure_mapping(profile, map_csv, product_types, progress,
+                                                    days_back=days_back, sheet_appends=sheet_appends)
+    if build_map:
+        sheet_errors = wait_for_sheet_appends(sheet_appends, progress)
+        elapsed = round(time.time() - start_ts, 2)
+        return pd.DataFrame(), {
+            "message": f"Mapping built/updated. Total variants: {total_after}, added: {added}",
+            "updated": 0, "dry": 0, "errors": 0, "translated": 0,
+            "skipped": 0, "report_filename": "", "elapsed_secs": elapsed,
+            "sheet_append_errors": sheet_errors,
+        }
     if added:
         log(f"🔁 Mapping refreshed: +{added} new variants (total {total_after}).", progress)
 
     stock_map = load_shared_stock_csv(stock_csv_path)
     log(f"📥 Loaded stock rows: {len(stock_map)}", progress)
 
-    inv_map_df = pd.read_csv(map_csv, dtype=str)
+    inv_map_df = mapping_df if mapping_df is not None else _read_map(map_csv)
     if inv_map_df.empty:
+        wait_for_sheet_appends(sheet_appends, progress)
         raise RuntimeError("Mapping CSV is empty. Build mapping first.")
-
-    if product_types:
-        allowed = get_product_ids_for_types(graphql_endpoint, headers, product_types)
+    # Many variants share a product: categorical codes make the isin() filter cheap
+    inv_map_df["product_id"] = inv_map_df["product_id"].astype("category")
+
+    if product_types and set(product_types) == _mapping_product_types(map_csv):
+        log(f"🔎 Mapping already scoped to product types {product_types} → {len(inv_map_df)} variants", progress)
+    elif product_types:
+        # New variants may belong to products the cached ID set predates: refetch then
+        allowed = cached_product_ids_for_types(graphql_endpoint, headers, product_types,
+                                               refresh=invalidate_cache or added > 0)
         before = len(inv_map_df)
         inv_map_df = inv_map_df[inv_map_df["product_id"].isin(allowed)].copy()
         log(f"🔎 Product types {product_types} → {len(inv_map_df)}/{before} variants", progress)
@@ -780,77 +1585,110 @@ def run_update(*, store: str, sku_prefix: Optional[str], product_types: Optional
 
     before = len(inv_map_df)
 
-    def to_lookup_sku(s: str) -> Optional[str]:
-        if s in stock_map:
-            return s
-        t = translate_sku(s)
-        return t if t and t in stock_map else None
-
-    inv_map_df["lookup_sku"] = inv_map_df["sku"].astype(str).apply(to_lookup_sku)
-    translated_count = int((inv_map_df["lookup_sku"] != inv_map_df["sku"]).sum())
-    inv_map_df = inv_map_df[inv_map_df["lookup_sku"].notna()].copy()
+    # Vectorized translate_sku: passthrough when the raw SKU is stocked,
+    # otherwise the translated SKU when that one is stocked.
+    skus = inv_map_df["sku"].astype(str)
+    stock_keys = stock_map.index
+    direct = skus.isin(stock_keys)
+    # Only the misses need translating; direct hits keep their own SKU
+    lookup = skus.where(direct)
+    miss = ~direct
+    # Translated SKUs always start with _SKU_BASE: skip the regex for SKUs that can't
+    # translate, and skip translation entirely if no stock key could receive it
+    candidates = miss & skus.str.startswith(f"{_SKU_BASE}-")
+    if candidates.any() and len(stock_keys) and stock_keys.astype(str).str.startswith(_SKU_BASE).any():
+        translated = translate_sku_series(skus[candidates])
+        lookup[candidates] = translated.where(translated.isin(stock_keys))
+    inv_map_df["lookup_sku"] = lookup
+    inv_map_df["translated"] = miss  # kept rows that missed directly resolved via translation
+    valid = lookup.notna()
+    translated_count = int((valid & miss).sum())
+    inv_map_df = inv_map_df.loc[valid].copy()
     log(f"🔗 Stock matches: {len(inv_map_df)}/{before} (translated: {translated_count})", progress)
 
     if inv_map_df.empty:
+        sheet_errors = wait_for_sheet_appends(sheet_appends, progress)
         elapsed = round(time.time() - start_ts, 2)
         return pd.DataFrame(), {
             "updated": 0, "dry": 0, "errors": 0, "translated": translated_count,
             "skipped": before, "report_filename": "", "elapsed_secs": elapsed,
-            "message": "Nothing to update after filters."
+            "message": "Nothing to update after filters.",
+            "sheet_append_errors": sheet_errors,
         }
 
-    location_gid = get_location_gid(graphql_endpoint, headers, location_name)
+    location_gid = cached_location_gid(graphql_endpoint, headers, location_name, refresh=invalidate_cache)
     log(f"📦 Using location: {location_gid}", progress)
 
-    updates = []
-    for _, row in inv_map_df.iterrows():
-        key = row["lookup_sku"]
-        updates.append({
-            "inventoryItemId": row["inventory_item_id"],
-            "quantity": int(stock_map[key]),
-            "sku": str(row["sku"]),
-            "resolved_sku": key,
-        })
+    inv_map_df = inv_map_df.join(stock_map, on="lookup_sku", how="inner")
+    # The same inventory item can appear under several mapping rows; send it once (last wins)
+    joined = len(inv_map_df)
+    inv_map_df = inv_map_df.drop_duplicates(subset=["inventory_item_id"], keep="last")
+    if len(inv_map_df) < joined:
+        log(f"🧹 Dropped {joined - len(inv_map_df)} duplicate inventory item(s)", progress)
+    # Only the two fields the mutation sends; sku/resolved_sku live in report_df
+    updates = (
+        inv_map_df[["inventory_item_id", "qty"]]
+        .rename(columns={"inventory_item_id": "inventoryItemId", "qty": "quantity"})
+        .to_dict("records")
+    )
 
     total = len(updates)
+    if batch_size > SET_QUANTITIES_MAX:
+        log(f"[WARN] batch_size {batch_size} exceeds Shopify's {SET_QUANTITIES_MAX} items per mutation; clamping.", progress)
+        batch_size = SET_QUANTITIES_MAX
     log(f"🚚 Updating {total} variants in batches of {batch_size} (dry_run={dry_run})…", progress)
 
-    report_rows = []
-    translated_lookup = set(inv_map_df[inv_map_df["lookup_sku"] != inv_map_df["sku"]]["sku"].tolist())
-
-    processed = 0
-    for i in range(0, total, batch_size):
-        batch = updates[i:i+batch_size]
-        ok, user_errors = set_on_hand_quantities(graphql_endpoint, headers, batch, location_gid, dry_run, progress=progress)
-        if ok:
-            for b in batch:
-                report_rows.append({
-                    "sku": b["sku"], "resolved_sku": b["resolved_sku"], "new_qty": b["quantity"],
-                    "status": "dry-run" if dry_run else "updated",
-                    "translated": "yes" if b["sku"] in translated_lookup else "no",
-                    "error": ""
-                })
-        else:
-            msg = "; ".join([e.get("message", "") for e in (user_errors or [])])
-            for b in batch:
-                report_rows.append({
-                    "sku": b["sku"], "resolved_sku": b["resolved_sku"], "new_qty": b["quantity"],
-                    "status": "error",
-                    "translated": "yes" if b["sku"] in translated_lookup else "no",
-                    "error": msg
-                })
-        processed += len(batch)
-        log(f"   ✓ {processed}/{total}", progress)
-        time.sleep(SLEEP_BETWEEN_CALLS)
-
-    report_df = pd.DataFrame(report_rows)
-    updated = int((report_df["status"] == "updated").sum())
-    dry = int((report_df["status"] == "dry-run").sum())
-    errs = int((report_df["status"] == "error").sum())
+    report_df = pd.DataFrame({
+        "sku": inv_map_df["sku"].astype(str).to_numpy(),
+        "resolved_sku": inv_map_df["lookup_sku"].to_numpy(),
+        "new_qty": inv_map_df["qty"].to_numpy(),
+        "translated": np.where(inv_map_df["translated"].to_numpy(), "yes", "no"),
+    })
+
+    def push_group(group):
+        if not dry_run:
+            _BUCKET.acquire(MUTATION_COST_ESTIMATE * len(group))
+        # progress stays on the calling thread: Streamlit callbacks can't run in workers
+        return set_on_hand_quantities(graphql_endpoint, headers,
+                                      [updates[i:i+batch_size] for i in group], location_gid, dry_run)
+
+    batch_starts = list(range(0, total, batch_size))
+    groups = [batch_starts[g:g+MUTATION_ALIASES_PER_REQUEST]
+              for g in range(0, len(batch_starts), MUTATION_ALIASES_PER_REQUEST)]
+    status = np.empty(total, dtype=object)
+    error = np.full(total, "", dtype=object)
+
+    processed = ok_rows = errs = 0
+    with ThreadPoolExecutor(max_workers=UPDATE_MAX_WORKERS) as pool:
+        # Slow start: until a response has seeded the bucket there is no cost budget to pace
+        # against, so the first group goes alone before the window opens to UPDATE_MAX_WORKERS.
+        first = pool.submit(push_group, groups[0])
+        if not dry_run and _BUCKET.available is None:
+            first.exception()  # blocks until done; any error is raised by result() below
+        futures = {first: groups[0]}
+        futures.update({pool.submit(push_group, group): group for group in groups[1:]})
+        for fut in as_completed(futures):
+            for i, (ok, user_errors) in zip(futures[fut], fut.result()):
+                j = min(i + batch_size, total)
+                if ok:
+                    status[i:j] = "dry-run" if dry_run else "updated"
+                    ok_rows += j - i
+                else:
+                    status[i:j] = "error"
+                    error[i:j] = "; ".join([e.get("message", "") for e in (user_errors or [])])
+                    errs += j - i
+                processed += j - i
+            log(f"   ✓ {processed}/{total}", progress)
+
+    # Broadcast per-batch outcomes onto the per-row report
+    report_df.insert(3, "status", status)
+    report_df["error"] = error
+
+    sheet_errors = wait_for_sheet_appends(sheet_appends, progress)
+    updated, dry = (0, ok_rows) if dry_run else (ok_rows, 0)
     elapsed = round(time.time() - start_ts, 2)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    report_filename = f"update_report_{store}_{ts}.csv"
-    report_df.to_csv(report_filename, index=False)
+    report_filename = _write_report(report_df, f"update_report_{store}_{ts}.csv")
 
     return report_df, {
         "updated": updated,
@@ -860,4 +1698,5 @@ def run_update(*, store: str, sku_prefix: Optional[str], product_types: Optional
         "skipped": before - len(inv_map_df),
         "report_filename": report_filename,
         "elapsed_secs": elapsed,
+        "sheet_append_errors": sheet_errors,
     }
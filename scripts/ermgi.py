@@ -1,4 +1,5 @@
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from utils.sheet_config import SHEET_SOURCES
 from utils.gsheets_manager import get_services
 from utils.sheet_config import SHEET_SOURCES
@@ -8,16 +9,28 @@ def main():
     creds = get_credentials()
     print("Service account:", getattr(creds, "service_account_email", "unknown"))
 
-    _, sheets = get_services()
-    for store, ids in SHEET_SOURCES.items():
-        print(f"\nStore: {store}")
-        for i, sid in enumerate(ids, start=1):
-            try:
-                meta = sheets.spreadsheets().get(spreadsheetId=sid).execute()
-                titles = [s["properties"]["title"] for s in meta.get("sheets", [])]
-                print(f"  v{i}: OK  {sid} | tabs: {titles}")
-            except Exception as e:
-                print(f"  v{i}: FAIL {sid} | {e}")
+    # Fetch every spreadsheet's tab titles concurrently, then print in store order
+    jobs = [(store, i, sid) for store, ids in SHEET_SOURCES.items() for i, sid in enumerate(ids, start=1)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda job: _tab_titles(job[2]), jobs))
+
+    current = None
+    for (store, i, sid), (titles, err) in zip(jobs, results):
+        if store != current:
+            print(f"\nStore: {store}")
+            current = store
+        if err is None:
+            print(f"  v{i}: OK  {sid} | tabs: {titles}")
+        else:
+            print(f"  v{i}: FAIL {sid} | {err}")
+
+def _tab_titles(sid):
+    try:
+        _, sheets = get_services()  # per-thread client
+        meta = sheets.spreadsheets().get(spreadsheetId=sid, fields="sheets.properties.title").execute()
+        return [s["properties"]["title"] for s in meta.get("sheets", [])], None
+    except Exception as e:
+        return None, e
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
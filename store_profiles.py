@@ -1,13 +1,14 @@
 import streamlit as st
+from core import StoreProfile
 
 STORE_PROFILES = {}
 
 for store, creds in st.secrets["store_profiles"].items():
-    STORE_PROFILES[store] = {
-        "SHOP_URL": creds["SHOP_URL"],
-        "ACCESS_TOKEN": creds["ACCESS_TOKEN"],
-        "MAP_CSV": f"utils/shopify_inventory_map_{store}.csv",
-        "DEFAULT_SKU_PREFIX": "",
-        "DEFAULT_PRODUCT_TYPES": [],
-        "LOCATION_NAME": None
-    }
+    STORE_PROFILES[store] = StoreProfile(
+        shop_url=creds["SHOP_URL"],
+        access_token=creds["ACCESS_TOKEN"],
+        map_csv=f"utils/shopify_inventory_map_{store}.csv",
+        default_sku_prefix="",
+        default_product_types=(),
+        location_name=None,
+    )
@@ -1,39 +1,37 @@
 # ---- Size check helpers: latest = highest numeric suffix only ----
-import re
+import os
 from pathlib import Path
-from merge_google_sheets_for_stores import SIZE_WARN_MB, SIZE_ALERT_MB, SIZE_HARD_MB
-
-# Only match suffixed parts: shopify_inventory_map_<store>_<N>.csv
-PART_RE = re.compile(r"^shopify_inventory_map_(?P<store>[a-z0-9_-]+)_(?P<num>\d+)\.csv$", re.IGNORECASE)
+from merge_google_sheets_for_stores import SIZE_WARN_MB, SIZE_ALERT_MB, SIZE_HARD_MB, PART_RE
 
 WARN_MB = SIZE_WARN_MB
 ALERT_MB = SIZE_ALERT_MB
 HARD_MB = SIZE_HARD_MB
 
-def file_size_mb(path: Path) -> float:
+def file_size_mb(path: Path | os.DirEntry) -> float:
     return path.stat().st_size / (1024 * 1024)
 
-def find_parts_for_store(base_dir: Path, store: str) -> list[Path]:
+def find_parts_for_store(base_dir: Path, store: str) -> list[os.DirEntry]:
+    """Suffixed parts as DirEntry objects: .stat() is cached, so sizes/mtimes cost no extra syscall."""
     parts = []
-    for p in base_dir.iterdir():
-        if not p.is_file() or p.suffix.lower() != ".csv":
-            continue
-        m = PART_RE.match(p.name)
-        if not m:
-            continue
-        if m.group("store").lower() == store.lower():
-            parts.append(p)
+    store_key = store.lower()
+    with os.scandir(base_dir) as it:
+        for de in it:
+            if not de.name.lower().endswith(".csv") or not de.is_file():
+                continue
+            m = PART_RE.match(de.name)
+            if m and m.group("store").lower() == store_key:
+                parts.append(de)
     return parts
 
-def pick_latest_part(parts: list[Path]) -> Path | None:
+def pick_latest_part(parts: list[os.DirEntry]) -> os.DirEntry | None:
     """Return the part with the highest numeric suffix, or None if none."""
     if not parts:
         return None
-    def keyfn(p: Path):
+    def keyfn(p: os.DirEntry):
         m = PART_RE.match(p.name)
         n = int(m.group("num")) if m else -1
         return (n, p.stat().st_mtime)
-    return sorted(parts, key=keyfn)[-1]
+    return max(parts, key=keyfn)
 
 def check_latest_sizes(stores: list[str], base_dir: Path | None = None) -> None:
     """For each store, consider only suffixed parts (_N). Ignore base combined file."""
@@ -53,9 +51,8 @@ def check_latest_sizes(stores: list[str], base_dir: Path | None = None) -> None:
             continue
 
         # List all parts with sizes
-        parts_sorted = sorted(parts, key=lambda p: int(PART_RE.match(p.name).group('num')))
-        for p in parts_sorted:
-            num = int(PART_RE.match(p.name).group("num"))
+        numbered = sorted(((int(PART_RE.match(p.name).group("num")), p) for p in parts), key=lambda t: t[0])
+        for num, p in numbered:
             print(f"  - {p.name:40s}  {file_size_mb(p):8.2f} MB  (part {num})")
 
         latest = pick_latest_part(parts)
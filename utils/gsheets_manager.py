@@ -1,6 +1,8 @@
 import os
 import json
 import time
+import functools
+import threading
 from typing import List, Optional
 import pandas as pd
 from googleapiclient.discovery import build
@@ -12,10 +14,17 @@ SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
 ]
 
+CSV_WRITE_CHUNK_ROWS = 200_000  # to_csv streams this many rows at a time instead of one giant buffer
+
 def get_credentials():
     """
     Load Google service account credentials from Streamlit secrets or local fallback.
+    Cached per process; a new GOOGLE_APPLICATION_CREDENTIALS value reloads them.
     """
+    return _load_credentials(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS"))
+
+@functools.lru_cache(maxsize=1)
+def _load_credentials(_env_key: Optional[str]):
     # Try to load from st.secrets if available
     try:
         import streamlit as st
@@ -42,13 +51,22 @@ def get_credentials():
 
     raise RuntimeError("❌ Google service account credentials not found.")
 
+_THREAD_LOCAL = threading.local()
+
 def get_services():
     """
     Returns authenticated Google Drive and Sheets clients.
+    Built once per thread (httplib2 transports aren't thread-safe) and rebuilt
+    if the credentials change.
     """
     creds = get_credentials()
-    drive = build("drive", "v3", credentials=creds, cache_discovery=False)
-    sheets = build("sheets", "v4", credentials=creds, cache_discovery=False)
+    cached = getattr(_THREAD_LOCAL, "services", None)
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+    # static_discovery: use the discovery docs bundled with google-api-python-client>=2, no HTTP fetch
+    drive = build("drive", "v3", credentials=creds, cache_discovery=False, static_discovery=True)
+    sheets = build("sheets", "v4", credentials=creds, cache_discovery=False, static_discovery=True)
+    _THREAD_LOCAL.services = (creds, (drive, sheets))
     return drive, sheets
 
 def get_service_account_email():
@@ -88,8 +106,7 @@ def create_new_sheet_for_store(store_name: str, parent_folder_id: Optional[str]
     title = f"shopify_inventory_map_{store_name}_{next_n}"
 
     # --- create via Drive API ---
-    creds = get_credentials()
-    drive = build("drive", "v3", credentials=creds)
+    drive, _ = get_services()
     metadata = {
         "name": title,
         "mimeType": "application/vnd.google-apps.spreadsheet",
@@ -153,10 +170,13 @@ def read_sheet_as_dataframe(spreadsheet_id: str, sheet_title: Optional[str] = No
     if not values:
         return pd.DataFrame()
     header = values[0]
-    rows = values[1:]
-    width = len(header)
-    norm_rows = [row + [""] * (width - len(row)) for row in rows]
-    return pd.DataFrame(norm_rows, columns=header)
+    # Sheets trims trailing empty cells: let the constructor pad short rows with NaN in C
+    # (width = longest row), then add any trailing header columns no row reached
+    df = pd.DataFrame(values[1:])
+    for i in range(df.shape[1], len(header)):
+        df[i] = None
+    df.columns = header
+    return df.fillna("")
 
 def merge_sheets_to_dataframe(
     spreadsheet_ids: List[str],
@@ -165,23 +185,11 @@ def merge_sheets_to_dataframe(
     """
     Merges multiple sheets into a unified DataFrame with aligned columns.
     """
-    dfs = []
-    union_cols = None
-    for sid in spreadsheet_ids:
-        df = read_sheet_as_dataframe(sid, sheet_title)
-        if df.empty:
-            continue
-        if union_cols is None:
-            union_cols = list(df.columns)
-        else:
-            for c in df.columns:
-                if c not in union_cols:
-                    union_cols.append(c)
-        dfs.append(df)
+    dfs = [df for df in (read_sheet_as_dataframe(sid, sheet_title) for sid in spreadsheet_ids) if not df.empty]
     if not dfs:
         return pd.DataFrame()
-    dfs = [d.reindex(columns=union_cols) for d in dfs]
-    return pd.concat(dfs, ignore_index=True)
+    # outer join keeps the union of columns in first-seen order
+    return pd.concat(dfs, ignore_index=True, join="outer", sort=False)
 
 def merge_sheets_to_csv(
     spreadsheet_ids: List[str],
@@ -196,5 +204,5 @@ def merge_sheets_to_csv(
         with open(out_path, "w", newline="", encoding="utf-8") as f:
             pass
         return out_path
-    df.to_csv(out_path, index=False)
+    df.to_csv(out_path, index=False, chunksize=CSV_WRITE_CHUNK_ROWS)
     return out_path
@@ -2,12 +2,15 @@ import sys
 import io
 import os
 import re
+import csv
 import json
+import shutil
 from pathlib import Path
 from typing import List, Optional, Dict, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from utils.gsheets_manager import read_sheet_as_dataframe
-from utils.utils_io import upload_csv_to_gsheet
+from utils.gsheets_manager import read_sheet_as_dataframe, CSV_WRITE_CHUNK_ROWS
+from utils.utils_io import upload_csv_to_new_gsheet
 
 import streamlit as st
 from google.oauth2 import service_account
@@ -30,6 +33,11 @@ SIZE_WARN_MB = 40
 SIZE_ALERT_MB = 50
 SIZE_HARD_MB = 60
 
+# Only suffixed parts: shopify_inventory_map_<store>_<N>.csv (compiled once, shared with check_csv_sizes)
+PART_RE = re.compile(r"^shopify_inventory_map_(?P<store>[a-z0-9_-]+)_(?P<num>\d+)\.csv$", re.IGNORECASE)
+
+DOWNLOAD_WORKERS = 8  # concurrent spreadsheet exports in save_sheets_to_csvs
+
 # Dynamic mapping from sheet_ids.json
 def load_sheet_sources() -> Dict[str, List[str]]:
     try:
@@ -38,11 +46,23 @@ def load_sheet_sources() -> Dict[str, List[str]]:
     except Exception:
         return {}
 
+def list_parts(store: str) -> List[tuple[int, Path]]:
+    """(N, path) for every shopify_inventory_map_<store>_<N>.csv in BASE_DIR, sorted by N."""
+    parts = []
+    store_key = store.lower()
+    for f in BASE_DIR.glob(f"shopify_inventory_map_{store}_*.csv"):
+        m = PART_RE.match(f.name)
+        if m and m.group("store").lower() == store_key:
+            parts.append((int(m.group("num")), f))
+    parts.sort()
+    return parts
+
 def save_sheets_to_csvs(force: bool = False, progress: Optional[Callable[[str], None]] = None, stores: Optional[list[str]] = None):
     _log("📥 Exporting Google Sheets to local CSVs...\n", progress)
     sources = load_sheet_sources()
     target_stores = stores or sources.keys()
 
+    jobs = []
     for store in target_stores:
         ids = sources.get(store, [])
         for idx, sid in enumerate(ids, start=1):
@@ -50,29 +70,35 @@ def save_sheets_to_csvs(force: bool = False, progress: Optional[Callable[[str],
             if out_path.exists() and not force:
                 _log(f"⏩ Skipping existing: {out_path.name}", progress)
                 continue
+            jobs.append((store, idx, sid, out_path))
+
+    if not jobs:
+        return
+    # Downloads are network-bound: run them concurrently, log from this thread only
+    with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(jobs))) as pool:
+        futures = {pool.submit(_download_sheet_csv, sid, out_path): (store, idx, out_path)
+                   for store, idx, sid, out_path in jobs}
+        for fut in as_completed(futures):
+            store, idx, out_path = futures[fut]
             try:
-                df = read_sheet_as_dataframe(spreadsheet_id=sid, sheet_title=DEFAULT_SHEET_TITLE)
-                df.to_csv(out_path, index=False)
+                fut.result()
                 _log(f"✅ Saved: {out_path.name}", progress)
             except Exception as e:
                 _log(f"[ERROR] Failed to download {store}_{idx}: {e}", progress)
 
+def _download_sheet_csv(sid: str, out_path: Path) -> None:
+    df = read_sheet_as_dataframe(spreadsheet_id=sid, sheet_title=DEFAULT_SHEET_TITLE)
+    df.to_csv(out_path, index=False, chunksize=CSV_WRITE_CHUNK_ROWS)
+
 def check_and_create_new_sheet_if_necessary(progress: Optional[Callable[[str], None]] = None, stores: Optional[list[str]] = None):
     sources = load_sheet_sources()
     target_stores = stores or sources.keys()
 
     for store in target_stores:
-        pattern = BASE_DIR.glob(f"shopify_inventory_map_{store}_*.csv")
-        files = []
-        for f in pattern:
-            m = re.match(rf"shopify_inventory_map_{store}_(\d+)\.csv", f.name)
-            if m:
-                files.append((int(m.group(1)), f))
-
+        files = list_parts(store)
         if not files:
             continue
 
-        files.sort()
         latest_version, latest_file = files[-1]
         size_mb = round(latest_file.stat().st_size / (1024 * 1024), 2)
 
@@ -80,7 +106,7 @@ def check_and_create_new_sheet_if_necessary(progress: Optional[Callable[[str], N
             _log(f"[HARD] {latest_file.name} is {size_mb} MB → ⛔⛔ Creating new Google Sheet… ⛔⛔", progress)
 
             try:
-                new_sheet_id = upload_csv_to_gsheet(str(latest_file), store)
+                new_sheet_id = upload_csv_to_new_gsheet(str(latest_file), store)
                 _log(f"✅ Created new Google Sheet and uploaded → ID: {new_sheet_id}", progress)
             except Exception as e:
                 _log(f"[ERROR] Failed to create/upload new Google Sheet: {e}", progress)
@@ -91,17 +117,10 @@ def check_latest_split_file_sizes(progress: Optional[Callable[[str], None]] = No
     target_stores = stores or sources.keys()
 
     for store in target_stores:
-        csv_files = list(BASE_DIR.glob(f"shopify_inventory_map_{store}_*.csv"))
-        versions = []
-        for f in csv_files:
-            m = re.match(rf"shopify_inventory_map_{store}_(\d+)\.csv", f.name)
-            if m:
-                versions.append((int(m.group(1)), f))
-
+        versions = list_parts(store)
         if not versions:
             continue
 
-        versions.sort()
         _, latest_file = versions[-1]
         size_mb = round(latest_file.stat().st_size / (1024 * 1024), 2)
 
@@ -122,18 +141,86 @@ def merge_sheets(progress: Optional[Callable[[str], None]] = None, stores: Optio
     target_stores = stores or sources.keys()
 
     for store in target_stores:
-        dfs = []
-        for idx in range(1, 100):  # up to 100 parts
-            path = BASE_DIR / f"shopify_inventory_map_{store}_{idx}.csv"
-            if path.exists():
-                try:
-                    dfs.append(pd.read_csv(path, dtype=str))
-                except Exception as e:
-                    _log(f"[ERROR] Failed to load {path.name}: {e}", progress)
-        if dfs:
-            out_csv = BASE_DIR / f"shopify_inventory_map_{store}.csv"
-            pd.concat(dfs, ignore_index=True).to_csv(out_csv, index=False)
-            _log(f"✅ Merged CSV saved → {out_csv.name}", progress)
+        paths = [path for _, path in list_parts(store)]
+        if not paths:
+            continue
+        out_csv = BASE_DIR / f"shopify_inventory_map_{store}.csv"
+        try:
+            merged = _concat_csv_parts(paths, out_csv)
+        except OSError as e:
+            _log(f"[ERROR] Byte merge failed for {store}: {e}", progress)
+            merged = False
+        if not merged:
+            # Headers differ between parts: align the columns (Arrow when available)
+            try:
+                merged = _merge_parts_arrow(paths, out_csv, progress)
+            except ImportError:
+                merged = _merge_parts_pandas(paths, out_csv, progress)
+            if not merged:
+                continue
+        _log(f"✅ Merged CSV saved → {out_csv.name}", progress)
+
+def _merge_parts_arrow(paths: List[Path], out_csv: Path, progress=None) -> bool:
+    """Read every part as all-string Arrow tables, union the columns, write with Arrow's CSV writer."""
+    import pyarrow as pa
+    import pyarrow.csv as pv
+
+    tables = []
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                names = next(csv.reader(f), [])
+            opts = pv.ConvertOptions(column_types={c: pa.string() for c in names}, strings_can_be_null=False)
+            tables.append(pv.read_csv(path, convert_options=opts))
+        except Exception as e:
+            _log(f"[ERROR] Failed to load {path.name}: {e}", progress)
+    if not tables:
+        return False
+    pv.write_csv(pa.concat_tables(tables, promote_options="default"), out_csv)
+    return True
+
+def _merge_parts_pandas(paths: List[Path], out_csv: Path, progress=None) -> bool:
+    dfs = []
+    for path in paths:
+        try:
+            dfs.append(pd.read_csv(path, dtype=str))
+        except Exception as e:
+            _log(f"[ERROR] Failed to load {path.name}: {e}", progress)
+    if not dfs:
+        return False
+    pd.concat(dfs, ignore_index=True).to_csv(out_csv, index=False, chunksize=CSV_WRITE_CHUNK_ROWS)
+    return True
+
+def _concat_csv_parts(paths: List[Path], out_csv: Path) -> bool:
+    """
+    Merge same-schema CSV parts by raw byte copy: one header, then each body.
+    Returns False without writing if the part headers don't match.
+    """
+    headers = []
+    for path in paths:
+        with open(path, "rb") as f:
+            headers.append(f.readline())
+    parts = [(p, h) for p, h in zip(paths, headers) if h.strip()]  # skip empty exports
+    if not parts or any(h.rstrip(b"\r\n") != parts[0][1].rstrip(b"\r\n") for _, h in parts):
+        return False
+
+    tmp = out_csv.with_name(out_csv.name + ".tmp")
+    with open(tmp, "wb") as out:
+        header = parts[0][1]
+        out.write(header if header.endswith(b"\n") else header + b"\n")
+        for path, h in parts:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size <= len(h):
+                    continue
+                f.seek(-1, os.SEEK_END)
+                ends_with_newline = f.read(1) == b"\n"
+                f.seek(len(h))
+                shutil.copyfileobj(f, out, length=1 << 20)
+                if not ends_with_newline:
+                    out.write(b"\n")
+    os.replace(tmp, out_csv)
+    return True
 
 def run(force_refresh: bool = False, progress=None, stores: Optional[list[str]] = None):
     if stores:
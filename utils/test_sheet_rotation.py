@@ -3,55 +3,59 @@ from pathlib import Path
 
 # Ensure we can import from the main app folder
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from utils_io import upload_csv_to_gsheet
+from utils_io import upload_csv_to_gsheet, _json_loads, _atomic_write_json
 from utils.gsheets_manager import create_new_sheet_for_store, get_first_sheet_title
 from constants import SIZE_HARD_MB
-import json
 import os
-import toml
 from pathlib import Path
 
-# Load .streamlit/secrets.toml manually
-secrets_path = Path(__file__).resolve().parent.parent / ".streamlit" / "secrets.toml"
-if secrets_path.exists():
-    secrets = toml.load(secrets_path)
-    # Optionally patch into global scope if needed
-    import streamlit as st
-    st.secrets = secrets
-else:
-    raise RuntimeError(f"Could not find secrets.toml at {secrets_path}")
-
-# rest of your logic here...
+try:
+    import tomllib  # stdlib C-backed parser (3.11+)
+except ImportError:  # Python 3.10 and older
+    tomllib = None
 
 
 STORE = "spoofy"
 CSV_FILENAME = Path("utils") / f"shopify_inventory_map_{STORE}_2.csv"
 SHEET_JSON = Path("utils/sheet_sources.json")
-
-def get_csv_size_mb(path: Path) -> float:
-    return round(path.stat().st_size / (1024 * 1024), 2)
+SECRETS_PATH = Path(__file__).resolve().parent.parent / ".streamlit" / "secrets.toml"
+
+def load_secrets():
+    """Load .streamlit/secrets.toml manually and patch it into st.secrets (only needed before an upload)."""
+    try:
+        if tomllib is not None:
+            with open(SECRETS_PATH, "rb") as f:
+                secrets = tomllib.load(f)
+        else:
+            import toml
+            secrets = toml.load(SECRETS_PATH)
+    except FileNotFoundError:
+        raise RuntimeError(f"Could not find secrets.toml at {SECRETS_PATH}")
+    import streamlit as st
+    st.secrets = secrets
 
 def update_json_file(new_id: str, store: str):
     data = {}
     if SHEET_JSON.exists():
-        with open(SHEET_JSON, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        with open(SHEET_JSON, "rb") as f:
+            data = _json_loads(f.read())
 
     data.setdefault(store, [])
     if new_id not in data[store]:
         data[store].append(new_id)
 
-    with open(SHEET_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    _atomic_write_json(SHEET_JSON, data)
     print(f"✅ Updated {SHEET_JSON} with new ID: {new_id}")
 
 def main():
     csv_path = Path(CSV_FILENAME)
-    if not csv_path.exists():
+    try:
+        stat_result = csv_path.stat()  # one stat covers both the existence check and the size
+    except FileNotFoundError:
         print(f"[ERROR] CSV not found at: {csv_path.resolve()}")
         return
 
-    size = get_csv_size_mb(csv_path)
+    size = round(stat_result.st_size / (1024 * 1024), 2)
     print(f"📦 {CSV_FILENAME} is {size:.2f} MB")
 
     if size < SIZE_HARD_MB:
@@ -59,6 +63,7 @@ def main():
         return
 
     print("🚨 Over size limit! Creating new Google Sheet and uploading…")
+    load_secrets()
 
     # 1. Create new Google Sheet
     PARENT_FOLDER = "1q78FNNF4FrjTjYaQvPPfZU-0CYlhPMoC"
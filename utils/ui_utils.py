@@ -1,6 +1,8 @@
 # ui_utils.py
 import streamlit as st
 import re
+import time
+from collections import deque
 
 SECTIONS = {
     "connection": "Connection",
@@ -12,29 +14,63 @@ SECTIONS = {
 }
 
 MAX_LINES_PER_SECTION = 400
+RENDER_DEBOUNCE_S = 0.2  # re-render a section's log at most this often; flush_sections() catches up
+
+# Matched against the lowercased message, so no IGNORECASE needed
+_SEVERITY_RE = re.compile(r"\[(hard|alert|warn)\].*?→.*?([\d\.]+)\s*mb")
+_SEVERITY_TAGS = ("[hard]", "[alert]", "[warn]")
+_SEVERITY_BADGES = {"HARD": "🚨", "ALERT": "⚠️", "WARN": "⚠️"}
+
+# (needles that must all appear, prefix-only?, section, summary, status info or None); first match wins
+_STATUS_RULES = (
+    (("connected to",), False, "connection", "✅ Connected", "🔌 Connecting to Shopify…"),
+    (("exporting google sheets",), False, "export", "⏳ Exporting", "📥 Exporting from Google Sheets…"),
+    (("✅ saved",), True, "export", "✅ Downloaded", None),
+    (("checking latest split csv",), False, "split_check", "⏳ Checking", "📦 Checking split CSV sizes…"),
+    (("merging sheets",), False, "merge", "⏳ Merging", "🔗 Merging split sheets…"),
+    (("merged csv saved",), False, "merge", "✅ Merged", None),
+    (("checking for new variants",), False, "mapping", "⏳ Scanning", "🔎 Checking for new variants…"),
+    (("no new variants",), False, "mapping", "✅ No new variants", None),
+    (("added", "new variants"), False, "mapping", "✅ Added", None),
+    (("updating", "batches"), False, "update", "⏳ Updating", "🚀 Updating stock in batches…"),
+)
 
 def setup_log_state():
     if "log_lines" not in st.session_state:
-        st.session_state.log_lines = {k: [] for k in SECTIONS}
+        st.session_state.log_lines = {k: deque(maxlen=MAX_LINES_PER_SECTION) for k in SECTIONS}
     if "seen" not in st.session_state:
         st.session_state.seen = {k: set() for k in SECTIONS}
+    # Sessions that predate the bounded deques still hold plain lists: convert, and
+    # re-derive `seen` from what survives the cap so the two stay in step
+    for k, v in st.session_state.log_lines.items():
+        if not isinstance(v, deque):
+            st.session_state.log_lines[k] = deque(v, maxlen=MAX_LINES_PER_SECTION)
+            st.session_state.seen[k] = set(st.session_state.log_lines[k])
     if "summaries" not in st.session_state:
         st.session_state.summaries = {k: "⏳ Pending" for k in SECTIONS}
     if "current_section" not in st.session_state:
         st.session_state.current_section = "connection"
+    if "last_render" not in st.session_state:
+        st.session_state.last_render = {k: 0.0 for k in SECTIONS}
+    if "dirty_sections" not in st.session_state:
+        st.session_state.dirty_sections = set()
     if "placeholders" not in st.session_state:
         st.session_state.placeholders = {
             k: {"header": st.empty(), "body": st.empty()} for k in SECTIONS
         }
 
 def _render_section(k: str):
+    ss = st.session_state  # each attribute access goes through the session-state proxy; bind once
     title = SECTIONS[k]
-    summary = st.session_state.summaries[k]
-    lines = st.session_state.log_lines[k]
+    summary = ss.summaries[k]
+    lines = ss.log_lines[k]
+    placeholders = ss.placeholders[k]
 
-    st.session_state.placeholders[k]["header"].markdown(f"**{title} — {summary}**")
+    ss.last_render[k] = time.monotonic()
+    ss.dirty_sections.discard(k)
+    placeholders["header"].markdown(f"**{title} — {summary}**")
 
-    with st.session_state.placeholders[k]["body"].expander(title, expanded=False):
+    with placeholders["body"].expander(title, expanded=False):
         if lines:
             st.code("\n".join(lines), language="text")
         else:
@@ -44,18 +80,29 @@ def render_all_sections():
     for _k in SECTIONS:
         _render_section(_k)
 
+def flush_sections():
+    """Render any section whose log changed since its last (debounced) render."""
+    for k in list(st.session_state.dirty_sections):
+        _render_section(k)
+
 def set_section(section_key: str, summary: str | None = None):
     if section_key in SECTIONS:
-        st.session_state.current_section = section_key
+        ss = st.session_state
+        prev = ss.current_section
+        if prev != section_key and prev in ss.dirty_sections:
+            _render_section(prev)  # don't leave the section we're leaving behind on stale lines
+        ss.current_section = section_key
         if summary is not None:
-            st.session_state.summaries[section_key] = summary
+            ss.summaries[section_key] = summary
         _render_section(section_key)
 
 def reset_ui_state():
     for k in SECTIONS:
-        st.session_state.log_lines[k] = []
+        st.session_state.log_lines[k] = deque(maxlen=MAX_LINES_PER_SECTION)
         st.session_state.seen[k] = set()
         st.session_state.summaries[k] = "⏳ Pending"
+        st.session_state.last_render[k] = 0.0
+    st.session_state.dirty_sections = set()
     st.session_state.current_section = "connection"
     st.session_state.placeholders = {
         k: {"header": st.empty(), "body": st.empty()} for k in SECTIONS
@@ -70,60 +117,49 @@ def make_push_with_status(status_placeholder):
         if not isinstance(msg, str):
             return
 
+        ss = st.session_state
+        summaries = ss.summaries
         lower = msg.lower().strip()
 
         # Status messages
-        if "connected to" in lower:
-            set_section("connection", "✅ Connected")
-            status_placeholder.info("🔌 Connecting to Shopify…")
-        elif "exporting google sheets" in lower:
-            set_section("export", "⏳ Exporting")
-            status_placeholder.info("📥 Exporting from Google Sheets…")
-        elif lower.startswith("✅ saved"):
-            set_section("export", "✅ Downloaded")
-        elif "checking latest split csv" in lower:
-            set_section("split_check", "⏳ Checking")
-            status_placeholder.info("📦 Checking split CSV sizes…")
-        elif "merging sheets" in lower:
-            set_section("merge", "⏳ Merging")
-            status_placeholder.info("🔗 Merging split sheets…")
-        elif "merged csv saved" in lower:
-            set_section("merge", "✅ Merged")
-        elif "checking for new variants" in lower:
-            set_section("mapping", "⏳ Scanning")
-            status_placeholder.info("🔎 Checking for new variants…")
-        elif "no new variants" in lower:
-            set_section("mapping", "✅ No new variants")
-        elif "added" in lower and "new variants" in lower:
-            set_section("mapping", "✅ Added")
-        elif "updating" in lower and "batches" in lower:
-            set_section("update", "⏳ Updating")
-            status_placeholder.info("🚀 Updating stock in batches…")
+        for needles, prefix, section, summary, info in _STATUS_RULES:
+            if lower.startswith(needles[0]) if prefix else all(n in lower for n in needles):
+                set_section(section, summary)
+                if info:
+                    status_placeholder.info(info)
+                break
 
         # Severity info
-        if "[hard]" in lower or "[alert]" in lower or "[warn]" in lower:
+        if any(t in lower for t in _SEVERITY_TAGS):
             set_section("split_check")
-            m = re.search(r"\[(HARD|ALERT|WARN)\].*?→.*?([\d\.]+)\s*MB", msg, re.IGNORECASE)
+            m = _SEVERITY_RE.search(lower)
             if m:
                 level = m.group(1).upper()
                 size = m.group(2)
-                badge = {"HARD": "🚨", "ALERT": "⚠️", "WARN": "⚠️"}[level]
-                st.session_state.summaries["split_check"] = f"{badge} {level} — {size} MB"
+                badge = _SEVERITY_BADGES[level]
+                summaries["split_check"] = f"{badge} {level} — {size} MB"
                 _render_section("split_check")
         if "call salah" in lower or "create a new sheet" in lower:
-            st.session_state.summaries["split_check"] = "🚨🚨🚨 — Copy the section below to Salah"
+            summaries["split_check"] = "🚨🚨🚨 — Copy the section below to Salah"
             _render_section("split_check")
         if " [latest]" in lower and "mb" in lower and "split" in lower:
-            if st.session_state.summaries["split_check"].startswith("⏳"):
-                st.session_state.summaries["split_check"] = "✅ Checked"
+            if summaries["split_check"].startswith("⏳"):
+                summaries["split_check"] = "✅ Checked"
                 _render_section("split_check")
 
         # Append log to current section
-        k = st.session_state.current_section
-        if msg not in st.session_state.seen[k]:
-            st.session_state.seen[k].add(msg)
-            st.session_state.log_lines[k].append(msg)
-            if len(st.session_state.log_lines[k]) > MAX_LINES_PER_SECTION:
-                st.session_state.log_lines[k] = st.session_state.log_lines[k][-MAX_LINES_PER_SECTION:]
-            _render_section(k)
+        k = ss.current_section
+        lines = ss.log_lines[k]
+        seen = ss.seen[k]
+        before = len(seen)
+        seen.add(msg)  # one hash lookup: the size only grows if msg is new
+        if len(seen) != before:
+            # Bounded deque drops the oldest line on append; forget it in `seen` too so both stay capped
+            if len(lines) == lines.maxlen:
+                seen.discard(lines[0])
+            lines.append(msg)
+            if time.monotonic() - ss.last_render[k] >= RENDER_DEBOUNCE_S:
+                _render_section(k)
+            else:
+                ss.dirty_sections.add(k)
     return push
@@ -1,42 +1,112 @@
 import os
 import csv
 import json
-import pandas as pd
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
 from pathlib import Path  # ✅ ADD THIS LINE
-from typing import Iterable, Dict, List, Optional, Union
-from utils.gsheets_manager import get_services, create_new_sheet_for_store
+from typing import Iterable, Iterator, Dict, List, Optional, Union
+from urllib.parse import quote
+import requests
+from utils.gsheets_manager import get_services, get_credentials, create_new_sheet_for_store
+
+# Single home of the orjson fast path (core.py and test_sheet_rotation import these)
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+    def _json_dumps_pretty(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:  # stdlib fallback, same bytes-in/bytes-out contract
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+    _json_loads = json.loads
+    def _json_dumps_pretty(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
 
 
 RowLike = Union[Dict[str, object], List[object]]
 
+SHEETS_VALUES_URL = "https://sheets.googleapis.com/v4/spreadsheets/{sid}/values/{a1}"
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_THREAD_LOCAL = threading.local()
+
 SHEET_ID_JSON_PATH = "utils/sheet_ids.json"
+UPLOAD_CHUNK_ROWS = 5000  # rows per values.update request (keeps each body well under the ~10MB cap)
+UPLOAD_WORKERS = 4        # concurrent chunk writes per sheet (stays under the per-sheet write quota)
+UPLOAD_RETRIES = 5        # 429/5xx retries with exponential backoff (update calls and chunk PUTs)
+UPLOAD_TIMEOUT_S = 60     # per chunk PUT; a stalled connection is retried instead of hanging a worker
+IO_BUFFER_BYTES = 1 << 20  # 1 MiB file buffers: row writes/reads coalesce into few syscalls
+
+_SHEET_MAP_CACHE = {"mtime": None, "data": None}  # sheet_ids.json contents, keyed by st_mtime_ns
+
+def _atomic_write_json(path: Union[str, Path], data) -> None:
+    """Write JSON via a temp file in the same folder + os.replace, so a crash never truncates `path`."""
+    _atomic_write_bytes(path, _json_dumps_pretty(data))
+
+def _atomic_write_bytes(path: Union[str, Path], data: bytes) -> None:
+    """Write `data` via a temp file in the same folder + fsync + os.replace: readers see old or new, never partial."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def _load_sheet_map() -> dict:
+    """Return the sheet_ids.json map, re-reading it only when its mtime changed."""
+    try:
+        mtime = os.stat(SHEET_ID_JSON_PATH).st_mtime_ns
+    except FileNotFoundError:
+        _SHEET_MAP_CACHE.update(mtime=None, data=None)
+        return {}
+    if _SHEET_MAP_CACHE["data"] is None or _SHEET_MAP_CACHE["mtime"] != mtime:
+        with open(SHEET_ID_JSON_PATH, "rb") as f:
+            _SHEET_MAP_CACHE.update(mtime=mtime, data=_json_loads(f.read()))
+    return _SHEET_MAP_CACHE["data"]
+
+def _save_sheet_map(sheet_map: dict) -> None:
+    _atomic_write_json(SHEET_ID_JSON_PATH, sheet_map)
+    _SHEET_MAP_CACHE.update(mtime=os.stat(SHEET_ID_JSON_PATH).st_mtime_ns, data=sheet_map)
 
 def ensure_dir(path: str) -> None:
     parent = os.path.dirname(os.path.abspath(path))
-    if parent and not os.path.exists(parent):
-        os.makedirs(parent, exist_ok=True)
+    if parent:
+        os.makedirs(parent, exist_ok=True)  # no-op when present; skips the separate exists() stat
 
 def get_csv_size_mb(path: str) -> float:
     try:
-        return os.path.getsize(path) / (1024 * 1024)
+        return os.stat(path).st_size / (1024 * 1024)
     except OSError:
         return 0.0
 
-def _normalize_rows(
+def _iter_normalized(
     rows: Iterable[RowLike],
     columns: Optional[List[str]] = None
-) -> List[List[object]]:
-    rows = list(rows)
-    if not rows:
-        return []
-    first = rows[0]
+) -> Iterator[Iterable[object]]:
+    """Yield each row as a sequence in `columns` order (dict rows) or as-is (list rows), one at a time."""
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
+        return
+    rows = chain((first,), it)
     if isinstance(first, dict):
         if columns is None:
             columns = list(first.keys())
-        matrix = [[r.get(col, "") for col in columns] for r in rows]  # type: ignore[arg-type]
-        return matrix
+        for r in rows:
+            yield [r.get(col, "") for col in columns]  # type: ignore[union-attr]
     else:
-        return [list(r) for r in rows]
+        yield from rows
 
 def save_csv_append(
     path: str,
@@ -44,40 +114,163 @@ def save_csv_append(
     columns: Optional[List[str]] = None,
     newline: str = ""
 ) -> None:
-    ensure_dir(path)
-    rows = list(rows)
-    if not rows:
+    # Peek the first row for the header/column decision; the rest streams straight to the writer
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
         return
+    ensure_dir(path)
 
-    file_exists = os.path.exists(path)
     infer_columns: Optional[List[str]] = None
-    if isinstance(rows[0], dict):
-        infer_columns = columns or list(rows[0].keys())
-
-    matrix = _normalize_rows(rows, columns or infer_columns)
+    if isinstance(first, dict):
+        infer_columns = columns or list(first.keys())
 
-    with open(path, "a", encoding="utf-8", newline=newline) as f:
+    with open(path, "a", encoding="utf-8", newline=newline, buffering=IO_BUFFER_BYTES) as f:
         writer = csv.writer(f)
-        if not file_exists and infer_columns:
+        # Append mode opens at EOF, so offset 0 means a new (or empty) file: no extra stat
+        if f.tell() == 0 and infer_columns:
             writer.writerow(infer_columns)
-        writer.writerows(matrix)
+        writer.writerows(_iter_normalized(chain((first,), it), columns or infer_columns))
+
+def _a1(tab: str, row: int) -> str:
+    """A1 anchor for column A of `row` in `tab` (quoted, so titles with spaces/quotes work)."""
+    return "'" + tab.replace("'", "''") + f"'!A{row}"
 
-def upload_csv_to_gsheet(csv_path: str, store_name: str) -> str:
+def _update_chunks(sheets, sid: str, tab: str, rows_iter: Iterable[List[str]], chunk: int = UPLOAD_CHUNK_ROWS) -> int:
+    """
+    Write rows to a sheet tab from A1 down in fixed-size values.update requests, each
+    anchored at its own row, so a re-upload overwrites the tab like one whole-file update.
+    Pulls `chunk` rows at a time from the iterator, so only one chunk is held in memory.
+    Returns the number of rows sent.
+    """
+    rows_iter = iter(rows_iter)
+    sent = 0
+    while True:
+        block = list(islice(rows_iter, chunk))
+        if not block:
+            return sent
+        sheets.spreadsheets().values().update(
+            spreadsheetId=sid,
+            range=_a1(tab, sent + 1),
+            valueInputOption="RAW",
+            body={"values": block}
+        ).execute(num_retries=UPLOAD_RETRIES)
+        sent += len(block)
+
+def _sheets_session():
+    """
+    Per-thread google-auth AuthorizedSession (pooled keep-alive connections),
+    rebuilt if the credentials change — same lifetime rules as get_services().
+    """
+    from google.auth.transport.requests import AuthorizedSession
+
+    creds = get_credentials()
+    cached = getattr(_THREAD_LOCAL, "session", None)
+    if cached is not None and cached[0] is creds:
+        return cached[1]
+    session = AuthorizedSession(creds)
+    _THREAD_LOCAL.session = (creds, session)
+    return session
+
+def _put_chunk(sid: str, a1: str, block: List[List[str]]) -> None:
+    # Runs on a worker thread. The body is serialised here with orjson and PUT as raw bytes,
+    # skipping googleapiclient's per-element stdlib JSON model.
+    payload = _json_dumps({"range": a1, "majorDimension": "ROWS", "values": block})
+    url = SHEETS_VALUES_URL.format(sid=sid, a1=quote(a1, safe=""))
+    session = _sheets_session()
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            resp = session.put(
+                url,
+                params={"valueInputOption": "RAW"},
+                data=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=UPLOAD_TIMEOUT_S,
+            )
+        except requests.Timeout:
+            if attempt >= UPLOAD_RETRIES:
+                raise
+        else:
+            if resp.status_code not in _RETRY_STATUSES or attempt >= UPLOAD_RETRIES:
+                resp.raise_for_status()
+                return
+        time.sleep(min(2 ** attempt, 32) + random.random())  # exponential backoff + jitter
+
+def _ensure_grid(sheets, sid: str, tab: str, n_rows: int, n_cols: int) -> None:
+    """Grow the tab's grid to at least n_rows x n_cols in one batchUpdate (no-op if it already fits)."""
+    meta = sheets.spreadsheets().get(
+        spreadsheetId=sid, fields="sheets.properties(sheetId,title,gridProperties)"
+    ).execute()
+    props = next(s["properties"] for s in meta["sheets"] if s["properties"]["title"] == tab)
+    grid = props.get("gridProperties", {})
+    if n_rows > grid.get("rowCount", 0) or n_cols > grid.get("columnCount", 0):
+        sheets.spreadsheets().batchUpdate(spreadsheetId=sid, body={"requests": [{
+            "updateSheetProperties": {
+                "properties": {"sheetId": props["sheetId"], "gridProperties": {
+                    "rowCount": max(n_rows, grid.get("rowCount", 0)),
+                    "columnCount": max(n_cols, grid.get("columnCount", 0)),
+                }},
+                "fields": "gridProperties(rowCount,columnCount)",
+            }
+        }]}).execute()
+
+def _upload_csv_chunks(
+    sheets,
+    sid: str,
+    tab: str,
+    csv_path: Union[str, Path],
+    chunk: int = UPLOAD_CHUNK_ROWS,
+    workers: int = UPLOAD_WORKERS,
+) -> int:
+    """
+    Upload a CSV into a tab, overwriting from A1 whatever its size: the grid is grown
+    to fit once, then every chunk is written with values.update at its fixed row offset.
+    Multi-chunk files are written concurrently (completion order doesn't matter).
+    Returns rows sent.
+    """
+    with open(csv_path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER_BYTES) as f:
+        n_rows = 0
+        n_cols = 0
+        for row in csv.reader(f):
+            n_rows += 1
+            if len(row) > n_cols:
+                n_cols = len(row)
+    if not n_rows:
+        return 0
+
+    _ensure_grid(sheets, sid, tab, n_rows, n_cols)
+
+    if n_rows <= chunk or workers <= 1:
+        with open(csv_path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER_BYTES) as f:
+            return _update_chunks(sheets, sid, tab, csv.reader(f), chunk)
+
+    with open(csv_path, "r", encoding="utf-8", newline="", buffering=IO_BUFFER_BYTES) as f, \
+         ThreadPoolExecutor(max_workers=workers) as ex:
+        rows_iter = csv.reader(f)
+        pending = []
+        start = 1
+        while True:
+            block = list(islice(rows_iter, chunk))
+            if not block:
+                break
+            pending.append(ex.submit(_put_chunk, sid, _a1(tab, start), block))
+            start += len(block)
+            # Bound the chunks held in memory to what the workers can have in flight
+            if len(pending) >= workers * 2:
+                pending.pop(0).result()
+        for fut in pending:
+            fut.result()
+    return start - 1
+
+def upload_csv_to_new_gsheet(csv_path: str, store_name: str) -> str:
     """
     Create a new Google Sheet, upload CSV content into it, and update utils/sheet_ids.json.
     Returns the new Google Sheet ID.
     """
     drive, sheets = get_services()
 
-    # Load the CSV as DataFrame
-    df = pd.read_csv(csv_path)
-
-    # Determine new sheet index
-    try:
-        with open(SHEET_ID_JSON_PATH, "r") as f:
-            sheet_map = json.load(f)
-    except FileNotFoundError:
-        sheet_map = {}
+    # Determine new sheet index (work on a copy; the cache only changes once the save lands)
+    sheet_map = {k: list(v) for k, v in _load_sheet_map().items()}
 
     existing_ids = sheet_map.get(store_name, [])
     new_index = len(existing_ids) + 1
@@ -90,19 +283,12 @@ def upload_csv_to_gsheet(csv_path: str, store_name: str) -> str:
     new_sheet = sheets.spreadsheets().create(body=body).execute()
     new_sheet_id = new_sheet["spreadsheetId"]
 
-    # Upload the data
-    values = [df.columns.tolist()] + df.fillna("").astype(str).values.tolist()
-    sheets.spreadsheets().values().update(
-        spreadsheetId=new_sheet_id,
-        range="Sheet1",
-        valueInputOption="RAW",
-        body={"values": values}
-    ).execute()
+    # Upload the data (header included) in chunks; cells go up as the original CSV text
+    _upload_csv_chunks(sheets, new_sheet_id, "Sheet1", csv_path)
 
     # Append ID to JSON
     sheet_map.setdefault(store_name, []).append(new_sheet_id)
-    with open(SHEET_ID_JSON_PATH, "w") as f:
-        json.dump(sheet_map, f, indent=2)
+    _save_sheet_map(sheet_map)
 
     return new_sheet_id
 
@@ -121,23 +307,8 @@ def upload_csv_to_gsheet(
     
     _, sheets = get_services()
 
-    # Read the CSV file content
-    with open(csv_path, "r", encoding="utf-8") as f:
-        lines = f.read().splitlines()
+    # Stream the CSV (csv.reader keeps quoted commas/newlines intact) and upload in chunks
+    sent = _upload_csv_chunks(sheets, spreadsheet_id, sheet_title, csv_path)
 
-    if not lines:
+    if not sent:
         print(f"[WARN] Empty CSV: {csv_path}")
-        return
-
-    rows = [line.split(",") for line in lines]
-
-    # Upload using batchUpdate
-    body = {
-        "values": rows
-    }
-    sheets.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id,
-        range=sheet_title,
-        valueInputOption="RAW",
-        body=body
-    ).execute()